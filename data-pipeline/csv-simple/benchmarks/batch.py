@@ -0,0 +1,60 @@
+"""Micro-benchmark: column batch processing against row-at-a-time processing."""
+import argparse
+import random
+import timeit
+
+from src import processors
+from src.processors import CsvProcessor
+
+HEADER = ('Name', 'Email', 'Comment', 'Created At')
+
+
+def generate_rows(count, seed=0):
+    rnd = random.Random(seed)
+    names = [f'user{i}' for i in range(count // 10 + 1)]
+    comments = ['', 'n/a', '-', 'assistant', 'manager', 'developer']
+    dates = ['', '11-11-2011', '12/12/12', '01-02-03', '31/12/1999', 'not a date']
+    rows = []
+    for _ in range(count):
+        name = rnd.choice(names)
+        email = rnd.choice([f'{name}@example.com', 'broken@', ''])
+        rows.append([name, email, rnd.choice(comments), rnd.choice(dates)])
+    return rows
+
+
+def process_rows(rows):
+    processor = CsvProcessor()
+    return [processor.process(row, HEADER) for row in rows]
+
+
+def process_columns(columns):
+    return CsvProcessor().process_batch(columns)
+
+
+def to_rows(valid, converted, count):
+    return [
+        {name: converted[name][i] for name in converted if valid[name][i]}
+        for i in range(count)
+    ]
+
+
+def main(count, repeat):
+    processors.logging.disable(processors.logging.CRITICAL)
+    rows = generate_rows(count)
+    columns = {key: [row[i] for row in rows] for i, key in enumerate(HEADER)}
+    backend = 'numpy' if processors.numpy is not None else 'python'
+    print(f'rows={count} backend={backend} equal={process_rows(rows) == to_rows(*process_columns(columns), count)}')
+    for name, function, argument in (('rows', process_rows, rows), ('batch', process_columns, columns)):
+        seconds = min(timeit.repeat(lambda: function(argument), number=1, repeat=repeat))
+        print(f'{name:>8}: {seconds:.4f}s {count / seconds:,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', default=100000, type=int, help='Rows to process (default=%(default)s).')
+    parser.add_argument('--repeat', default=3, type=int, help='Timing repeats (default=%(default)s).')
+    parser.add_argument('--no-numpy', action='store_true', help='Use the pure Python backend.')
+    args = parser.parse_args()
+    if args.no_numpy:
+        processors.numpy = None
+    main(args.count, args.repeat)
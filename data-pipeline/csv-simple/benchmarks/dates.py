@@ -0,0 +1,52 @@
+"""Micro-benchmark: compiled DateParser against the strptime template loop."""
+import argparse
+import random
+import timeit
+from datetime import datetime
+
+from src.dates import DateParser
+from src.processors import CsvProcessor
+
+
+def parse_strptime(value, templates=CsvProcessor.DATETIME_TEMPLATES):
+    for dt_format in templates:
+        try:
+            return datetime.strptime(value, dt_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def generate_values(count, distinct, seed=0):
+    rnd = random.Random(seed)
+    pool = []
+    for _ in range(distinct):
+        day, month = rnd.randint(1, 28), rnd.randint(1, 12)
+        year = rnd.choice([f'{rnd.randint(0, 99):02d}', str(rnd.randint(1950, 2030))])
+        pool.append(f'{day:02d}{rnd.choice("-/")}{month:02d}{rnd.choice("-/")}{year}')
+    pool.append('not a date')
+    return [rnd.choice(pool) for _ in range(count)]
+
+
+def main(count, distinct, repeat):
+    values = generate_values(count, distinct)
+    parser = DateParser(CsvProcessor.DATETIME_TEMPLATES)
+    mismatches = sum(parser.parse(value) != parse_strptime(value) for value in set(values))
+    print(f'values={count} distinct={distinct} mismatches={mismatches}')
+    parser = DateParser(CsvProcessor.DATETIME_TEMPLATES)
+    uncached = DateParser(CsvProcessor.DATETIME_TEMPLATES, cache_size=0)
+    for name, function in (
+            ('strptime', parse_strptime),
+            ('compiled', uncached.parse),
+            ('compiled+cache', parser.parse)):
+        seconds = min(timeit.repeat(lambda: [function(value) for value in values], number=1, repeat=repeat))
+        print(f'{name:>16}: {seconds:.4f}s {count / seconds:,.0f} values/s')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--count', default=100000, type=int, help='Values to parse (default=%(default)s).')
+    arg_parser.add_argument('--distinct', default=1000, type=int, help='Distinct values (default=%(default)s).')
+    arg_parser.add_argument('--repeat', default=3, type=int, help='Timing repeats (default=%(default)s).')
+    args = arg_parser.parse_args()
+    main(args.count, args.distinct, args.repeat)
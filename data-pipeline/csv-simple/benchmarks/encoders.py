@@ -0,0 +1,67 @@
+"""Micro-benchmark: JSON encoders serializing processed synthetic rows as NDJSON into memory."""
+import argparse
+import io
+import json
+import logging
+import os
+import tempfile
+import timeit
+from datetime import date
+
+import main as pipeline
+from benchmarks import generator
+from src.encoders import Encoder
+from src.loaders import Loader, WriteBuffer
+
+
+def serialize_legacy(items):
+    """Copy each item to format its dates, then json.dumps into a text stream."""
+    f = io.StringIO()
+    for item in items:
+        sanitised = {
+            key: value.strftime(Loader.DATE_FORMAT) if isinstance(value, date) else value
+            for key, value in item.items()
+        }
+        f.write(json.dumps(sanitised) + '\n')
+    return len(f.getvalue())
+
+
+def serialize(encoder, items):
+    f = io.BytesIO()
+    buffer = WriteBuffer(f, Loader.BUFFER_SIZE)
+    for item in items:
+        buffer.write(encoder.encode_line(item))
+    buffer.flush()
+    return len(f.getvalue())
+
+
+def load_items(rows, generator_options):
+    with tempfile.TemporaryDirectory(prefix='encoders-benchmark-') as work_dir:
+        file_path = generator.write_csv(os.path.join(work_dir, 'data.csv'), rows, **generator_options)
+        log = logging.getLogger('benchmark')
+        records = pipeline.transform(log, pipeline.extract(log, [file_path], 0))
+        return [record.data for record in records if record.data is not None]
+
+
+def main(rows, repeat, generator_options):
+    items = load_items(rows, generator_options)
+    candidates = [('legacy', serialize_legacy)]
+    for name in Encoder.PREFERENCE:
+        encoder = Encoder.get_instance(name, date_format=Loader.DATE_FORMAT)
+        if encoder:
+            candidates.append((name, lambda values, encoder=encoder: serialize(encoder, values)))
+        else:
+            print(f'{name:>8}: not installed')
+    for name, function in candidates:
+        size = function(items)
+        seconds = min(timeit.repeat(lambda: function(items), number=1, repeat=repeat))
+        print(f'{name:>8}: {seconds:.4f}s {len(items) / seconds:,.0f} rows/s {size:,} bytes')
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    generator.add_arguments(arg_parser)
+    arg_parser.add_argument('--repeat', default=3, type=int, help='Timing repeats (default=%(default)s).')
+    args = arg_parser.parse_args()
+    main(args.rows, args.repeat, generator.generator_options(args))
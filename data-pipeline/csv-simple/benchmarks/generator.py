@@ -0,0 +1,88 @@
+"""Synthetic CSV generator for the Name/Email/Comment/Created At schema."""
+import argparse
+import csv
+import random
+
+from src.processors import CsvProcessor
+
+HEADER = ('Name', 'Email', 'Comment', 'Created At')
+COMMENTS = ('assistant', 'manager', 'developer', 'contractor, part time', 'said "hello"')
+DIRECTIVES = {'%d': '{day:02d}', '%m': '{month:02d}', '%Y': '{year}', '%y': '{short_year:02d}'}
+
+
+def format_date(template, day, month, year):
+    for directive, field in DIRECTIVES.items():
+        template = template.replace(directive, field)
+    return template.format(day=day, month=month, year=year, short_year=year % 100)
+
+
+def generate_rows(rows, null_ratio=0.1, invalid_ratio=0.01, date_formats=CsvProcessor.DATETIME_TEMPLATES,
+                  distinct_dates=1000, seed=0):
+    """
+    Yield synthetic rows.
+
+    :param rows: number of rows
+    :param null_ratio: share of Comment and Created At values that are empty or one of NULL_VALUES
+    :param invalid_ratio: share of rows with an invalid email or date
+    :param date_formats: strptime templates to format Created At values with, picked uniformly
+    :param distinct_dates: number of distinct Created At values
+    :param seed: random seed
+    """
+    rnd = random.Random(seed)
+    nulls = ('',) + CsvProcessor.NULL_VALUES
+    dates = [
+        format_date(rnd.choice(date_formats), rnd.randint(1, 28), rnd.randint(1, 12), rnd.randint(1970, 2030))
+        for _ in range(distinct_dates)
+    ]
+    for i in range(rows):
+        name = f'user{i}'
+        email = f'{name}@example.com'
+        comment = rnd.choice(COMMENTS)
+        created_at = rnd.choice(dates)
+        if rnd.random() < null_ratio:
+            comment = rnd.choice(nulls)
+        if rnd.random() < null_ratio:
+            created_at = rnd.choice(nulls)
+        if rnd.random() < invalid_ratio:
+            if rnd.random() < 0.5:
+                email = f'{name}@invalid'
+            else:
+                created_at = '31-31-31'
+        yield name, email, comment, created_at
+
+
+def write_csv(file_path, rows, **kwargs):
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(generate_rows(rows, **kwargs))
+    return file_path
+
+
+def add_arguments(parser):
+    parser.add_argument('--rows', default=100000, type=int, help='Rows to generate (default=%(default)s).')
+    parser.add_argument(
+        '--null-ratio', default=0.1, type=float, help='Share of null optional values (default=%(default)s).')
+    parser.add_argument(
+        '--invalid-ratio', default=0.01, type=float, help='Share of rows with invalid values (default=%(default)s).')
+    parser.add_argument(
+        '--date-formats',
+        default=','.join(CsvProcessor.DATETIME_TEMPLATES),
+        help='Comma separated date templates to mix (default=%(default)s).')
+    parser.add_argument('--seed', default=0, type=int, help='Random seed (default=%(default)s).')
+
+
+def generator_options(args):
+    return dict(
+        null_ratio=args.null_ratio,
+        invalid_ratio=args.invalid_ratio,
+        date_formats=tuple(args.date_formats.split(',')),
+        seed=args.seed)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('file_path', help='CSV file to write.')
+    add_arguments(arg_parser)
+    arguments = arg_parser.parse_args()
+    write_csv(arguments.file_path, arguments.rows, **generator_options(arguments))
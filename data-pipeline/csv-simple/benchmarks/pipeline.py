@@ -0,0 +1,107 @@
+"""
+Pipeline benchmark: time extract, process and load stages separately and end to end on a synthetic CSV.
+
+Each stage runs in a fresh child process, so peak RSS is measured per stage. Results are printed as JSON.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import main as pipeline
+from benchmarks import generator
+from src.loaders import Loader
+
+STAGES = ('extract', 'process', 'load', 'end_to_end')
+
+
+def _extract(file_path, use_mmap):
+    return pipeline.extract(logging.getLogger('benchmark'), [file_path], checkpoint_rows=0, use_mmap=use_mmap)
+
+
+def _process(records):
+    return pipeline.transform(logging.getLogger('benchmark'), records)
+
+
+def _count(records):
+    """Count rows, not records only carrying markers."""
+    return sum(1 for record in records if record.data is not None)
+
+
+def run_stage(stage, file_path, output_dir, output_format, use_mmap):
+    """Child process entry point: run a stage, return its measurements."""
+    logging.disable(logging.CRITICAL)
+    os.chdir(output_dir)
+    rows_in = rows_out = 0
+    if stage == 'extract':
+        started = time.perf_counter()
+        rows_in = rows_out = _count(_extract(file_path, use_mmap))
+    elif stage == 'process':
+        records = list(_extract(file_path, use_mmap))
+        rows_in = _count(records)
+        started = time.perf_counter()
+        rows_out = _count(_process(records))
+    elif stage == 'load':
+        records = list(_process(_extract(file_path, use_mmap)))
+        rows_in = _count(records)
+        started = time.perf_counter()
+        rows_out = Loader.get_instance(output_format).dump(records)
+    else:
+        started = time.perf_counter()
+        rows_out = Loader.get_instance(output_format).dump(_process(_extract(file_path, use_mmap)))
+        rows_in = rows_out
+    seconds = time.perf_counter() - started
+    return dict(
+        stage=stage,
+        seconds=round(seconds, 6),
+        rows_in=rows_in,
+        rows_out=rows_out,
+        rows_per_second=round(rows_in / seconds, 1) if seconds else None,
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main(rows, stages, output_format, use_mmap, generator_options, input_path=None):
+    with tempfile.TemporaryDirectory(prefix='pipeline-benchmark-') as work_dir:
+        file_path = input_path or generator.write_csv(os.path.join(work_dir, 'data.csv'), rows, **generator_options)
+        file_path = os.path.abspath(file_path)
+        results = []
+        for stage in stages:
+            output_dir = tempfile.mkdtemp(dir=work_dir)
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(run_stage, stage, file_path, output_dir, output_format, use_mmap)
+                results.append(future.result())
+        return dict(
+            timestamp=datetime.now().isoformat(timespec='seconds'),
+            python=platform.python_version(),
+            input=dict(
+                file_size=os.path.getsize(file_path), rows=rows if not input_path else None, **generator_options),
+            options=dict(output_format=output_format, mmap=use_mmap),
+            stages=results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    generator.add_arguments(parser)
+    parser.add_argument(
+        '--input', default=None, help='Benchmark an existing CSV file instead of generating one (default=%(default)s).')
+    parser.add_argument(
+        '--stages', default=','.join(STAGES), help='Comma separated stages to run (default=%(default)s).')
+    parser.add_argument('--output-format', default='json', help='Loader output format (default=%(default)s).')
+    parser.add_argument('--mmap', default=False, action='store_true', help='Use memory-mapped extraction.')
+    args = parser.parse_args()
+    report = main(
+        args.rows,
+        args.stages.split(','),
+        args.output_format,
+        args.mmap,
+        generator.generator_options(args),
+        input_path=args.input)
+    json.dump(report, sys.stdout, indent=2)
+    print()
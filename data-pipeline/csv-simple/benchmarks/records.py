@@ -0,0 +1,51 @@
+"""Memory benchmark: bytes per extracted row for nested dict items against slotted records."""
+import argparse
+import csv
+import io
+import random
+import tracemalloc
+
+from src.records import Record, Source
+
+HEADER = ('Name', 'Email', 'Comment', 'Created At')
+
+
+def generate_csv(count, seed=0):
+    rnd = random.Random(seed)
+    lines = [','.join(HEADER)]
+    for i in range(count):
+        lines.append(f'user{i},user{i}@example.com,{rnd.choice(["", "n/a", "assistant"])},{rnd.randint(1, 28)}-11-2011')
+    return '\n'.join(lines) + '\n'
+
+
+def extract_dicts(text, file_name):
+    return [dict(data=row, file_type='csv', file=file_name) for row in csv.DictReader(io.StringIO(text))]
+
+
+def extract_records(text, file_name):
+    rows = csv.reader(io.StringIO(text))
+    source = Source(file_name, 'csv', tuple(next(rows)))
+    return [Record(source, row) for row in rows]
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    result = function(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def main(count):
+    text = generate_csv(count)
+    for name, function in (('dict items', extract_dicts), ('records', extract_records)):
+        size, result = measure(function, text, 'data.csv')
+        print(f'{name:>12}: rows={len(result)} bytes={size:,} bytes/row={size / len(result):.1f}')
+        del result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', default=100000, type=int, help='Rows to extract (default=%(default)s).')
+    args = parser.parse_args()
+    main(args.count)
@@ -1,4 +1,12 @@
 INPUT_DIR = 'input'
 OUTPUT_DIR = 'output'
+CHUNK_SIZE = 16 * 1024 * 1024
+OUTPUT_FORMAT = 'json'
+INDEX_FILE = '.index.sqlite'
+INDEX_RETENTION_DAYS = 90
+WATCH_DEBOUNCE = 0.2
+METRICS_PERIOD = 60
+METRICS_FILE = 'metrics.prom'
+DEDUP_FILE = '.dedup.sqlite'
 
 LOG_FORMAT = r'%(asctime)s:%(levelname)s:%(name)s:%(message)s'
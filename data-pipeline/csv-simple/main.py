@@ -3,61 +3,194 @@ import argparse
 import logging
 import os
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-from config import INPUT_DIR, LOG_FORMAT
+from config import (
+    CHUNK_SIZE, DEDUP_FILE, INDEX_FILE, INDEX_RETENTION_DAYS, INPUT_DIR, LOG_FORMAT, METRICS_FILE, METRICS_PERIOD,
+    OUTPUT_DIR, OUTPUT_FORMAT, WATCH_DEBOUNCE
+)
 from src import extractors
+from src.dedup import Deduplicator
 from src.extractors import Extractor
+from src.file_index import FileIndex
 from src.loaders import Loader
+from src.metrics import Metrics
+from src.partitions import Partitioner
 from src.processors import Processor
+from src.records import Record, Source
+from src.watchers import Watcher
 
 
-def main(log, input_dir, file_path=None):
+def get_extractor(file_path, use_mmap=False, **kwargs):
+    extractor = Extractor.get_instance(file_path, use_mmap=use_mmap, **kwargs)
+    if extractor and use_mmap:
+
+        # only fields the processor knows are decoded
+        processor_class = Processor.get_class(extractor.FILE_TYPE)
+        if processor_class:
+            extractor.columns = frozenset(processor_class.SCHEMA)
+    return extractor
+
+
+def extract(log, file_paths, checkpoint_rows=None, use_mmap=False, metrics=None, incremental=False):
+    for file_path in file_paths:
+        extractor = get_extractor(
+            file_path, use_mmap=use_mmap, checkpoint_rows=checkpoint_rows, incremental=incremental)
+        if not extractor:
+            log.warning(f'could not extract {file_path}')
+            continue
+        completed = yield from extractor.extract()
+        if metrics is not None:
+            metrics.files += 1
+            metrics.bytes_read += extractor.bytes_read
+        if completed:
+
+            # the loader records the file as processed once its output is written
+            yield Record(Source(file_path, extractor.FILE_TYPE), None, completed=(file_path, extractor.incremental))
+
+
+def transform(log, records, metrics=None):
+    rejected = metrics.rejected if metrics is not None else None
+    processors = {}
+    for record in records:
+        if record.data is None:
+            yield record
+            continue
+        file_type = record.source.file_type
+        if file_type in processors:
+            processor = processors[file_type]
+        else:
+            processor = processors[file_type] = Processor.get_shared_instance(file_type, rejected=rejected)
+        if not processor:
+            log.error(f'could not process file type {file_type}')
+            continue
+        processed = processor.process(record.data, record.source.header)
+        if processed:
+            record.data = processed
+            yield record
+        else:
+            log.error(f'could not process processed={processed} record={record}')
+
+
+def process_chunk(file_path, byte_range, use_mmap=False):
+    """
+    Worker entry point: extract and process a byte range of a file, the whole file if byte_range is None.
+
+    :return: tuple of (completed, list of (source, processed rows), metrics of the chunk)
+    """
+    log = logging.getLogger('pipeline.worker')
+    extractor = get_extractor(file_path, use_mmap=use_mmap, byte_range=byte_range, checkpoint_rows=0)
+    metrics = Metrics()
+    status = []
+
+    def extracted():
+
+        # completion is reported to the parent process, which keeps the file index
+        status.append((yield from extractor._extract()))
+
+    groups = []
+    for record in transform(log, metrics.timed('extract', extracted()), metrics):
+        if not groups or groups[-1][0] is not record.source:
+            groups.append((record.source, []))
+        groups[-1][1].append(record.data)
+    metrics.bytes_read = extractor.bytes_read
+    return bool(status and status[0]), groups, metrics
+
+
+def transform_parallel(log, file_paths, workers, chunk_size, use_mmap=False, metrics=None):
+    failed = set()
+
+    def drain(pending):
+        extractor, is_last, future = pending.popleft()
+        try:
+            completed, groups, chunk_metrics = future.result()
+        except Exception as error:
+            log.exception(error)
+            completed, groups, chunk_metrics = False, [], None
+        if not completed:
+            failed.add(extractor.file_path)
+        if metrics is not None and chunk_metrics is not None:
+            metrics.rows['extract'] += chunk_metrics.rows['extract']
+            metrics.rejected.update(chunk_metrics.rejected)
+            metrics.bytes_read += chunk_metrics.bytes_read
+            metrics.files += is_last
+        for source, data in groups:
+            for processed in data:
+                yield Record(source, processed)
+        if is_last and extractor.file_path not in failed:
+            yield Record(Source(extractor.file_path, extractor.FILE_TYPE), None, completed=(extractor.file_path, False))
+
+    # results are drained in submission order, so output naming matches the serial run
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            extractor = Extractor.get_instance(file_path)
+            if not extractor:
+                log.warning(f'could not extract {file_path}')
+                continue
+            byte_ranges = extractor.byte_ranges(chunk_size)
+            for index, byte_range in enumerate(byte_ranges):
+                future = executor.submit(process_chunk, file_path, byte_range, use_mmap)
+                pending.append((extractor, index == len(byte_ranges) - 1, future))
+                if len(pending) >= workers * 2:
+                    yield from drain(pending)
+        while pending:
+            yield from drain(pending)
+
+
+def main(log, input_dir, file_path=None, file_paths=None, workers=1, chunk_size=CHUNK_SIZE, output_format=OUTPUT_FORMAT,
+         batch_size=None, checkpoint_rows=None, file_index=None, use_mmap=False, metrics=None, writers=0,
+         write_queue=None, encoder=None, incremental=False, dedup=None, output_dir=OUTPUT_DIR, partitioner=None,
+         max_file_size=None, max_file_records=None):
 
     # extract
     if file_path:
         log.info(f'scanning file_path={file_path}')
         file_paths = [file_path]
+    elif file_paths:
+        log.info(f'received file_paths={file_paths}')
     else:
         log.info(f'scanning input_dir={input_dir}')
         file_paths = extractors.scan_input_dir(input_dir)
-    data_cache = []
-    if file_paths:
-        for file_path in file_paths:
-            extractor = Extractor.get_instance(file_path)
-            if not extractor:
-                log.warning(f'could not extract {file_path}')
-                continue
-            data_item = extractor.extract()
-            if not data_item:
-                log.error(f'error extracting {file_path}')
-                continue
-            data_cache.extend(data_item)
+    if not file_paths:
+        log.info('nothing extracted')
+        return
 
-    # transform
-    log.info(f'processing data cache size={len(data_cache)}')
-    if not data_cache:
-        logging.info('nothing extracted')
+    # transform and load as a stream, one row at a time
+    if metrics is None:
+        metrics = Metrics()
+    if workers > 1 and incremental:
+        log.info('incremental mode extracts in the main process, ignoring workers')
+        workers = 1
+    if workers > 1:
+        log.info(f'processing with workers={workers} chunk_size={chunk_size}')
+        payload = metrics.timed('process', transform_parallel(log, file_paths, workers, chunk_size, use_mmap, metrics))
     else:
-        payload = []
-        for item in data_cache:
-            file_type = item['file_type']
-            processor = Processor.get_instance(file_type)
-            if not processor:
-                log.error(f'could not process file type {file_type}')
-                continue
-            processed = processor.process(item['data'])
-            if processed:
-                payload.append(dict(data=processed, file_type=file_type, file=item['file']))
-            else:
-                log.error(f'could not process processed={processed} item={item}')
-
-        # load
-        log.info(f'loading payload size={len(payload)}')
-        if not payload:
-            log.error('no payload')
-            return
-        Loader().dump(payload)
-    log.info('completed')
+        records = metrics.timed(
+            'extract', extract(log, file_paths, checkpoint_rows, use_mmap, metrics, incremental))
+        payload = metrics.timed('process', transform(log, records, metrics))
+    if dedup is not None:
+        dropped = dedup.dropped
+        payload = metrics.timed('dedup', dedup.filter(payload))
+    loader = Loader.get_instance(
+        output_format, batch_size=batch_size, checkpoints=file_index, writers=writers, queue_size=write_queue,
+        encoder=encoder, output_dir=output_dir, partitioner=partitioner, max_file_size=max_file_size,
+        max_file_records=max_file_records)
+    started = time.perf_counter()
+    dumped = loader.dump(payload)
+    metrics.add_time('load', time.perf_counter() - started)
+    metrics.rows['load'] += dumped
+    metrics.bytes_written += loader.bytes_written
+    if dedup is not None:
+        dropped = dedup.dropped - dropped
+        metrics.duplicates += dropped
+        log.info(f'dropped duplicates={dropped}')
+    metrics.end_run()
+    if not dumped:
+        log.error('no payload')
+        return
+    log.info(f'completed payload size={dumped}')
 
 
 if __name__ == '__main__':
@@ -73,20 +206,199 @@ if __name__ == '__main__':
     parser.add_argument(
         '-t', '--time-period',
         default=60,
-        help='Seconds to wait between scans of input directory (default=%default)s).')
+        type=int,
+        help='Seconds to wait between scans of input directory with --poll; with inotify, seconds without events '
+             'after which a file modified but not closed is ready (default=%(default)s).')
+    parser.add_argument(
+        '--poll',
+        default=False,
+        action='store_true',
+        help='Only scan input directory periodically, do not watch it with inotify (default=%(default)s).')
+    parser.add_argument(
+        '--debounce',
+        default=WATCH_DEBOUNCE,
+        type=float,
+        help='Seconds a written file must stay closed before it is processed (default=%(default)s).')
+    parser.add_argument(
+        '-w', '--workers',
+        default=1,
+        type=int,
+        help='Number of worker processes extracting and processing files in parallel (default=%(default)s).')
+    parser.add_argument(
+        '--mmap',
+        default=False,
+        action='store_true',
+        help='Tokenize input files from a memory map, decoding only the fields processed; '
+             'pays off for wide files (default=%(default)s).')
+    parser.add_argument(
+        '--chunk-size',
+        default=CHUNK_SIZE,
+        type=int,
+        help='Bytes of a file handed to a worker process at a time (default=%(default)s).')
+    parser.add_argument(
+        '-o', '--output-format',
+        default=OUTPUT_FORMAT,
+        choices=('json', 'ndjson', 'json-array', 'columnar'),
+        help='Output format: a JSON file per record, newline-delimited JSON per source, '
+             'JSON arrays of --batch-size records or columnar binary per source (default=%(default)s).')
+    parser.add_argument(
+        '--batch-size',
+        default=None,
+        type=int,
+        help='Records per JSON array file or columnar row group (default=%(default)s).')
+    parser.add_argument(
+        '--output-dir',
+        default=OUTPUT_DIR,
+        help='Directory to write output partitions to (default=%(default)s).')
+    parser.add_argument(
+        '--partition-by',
+        default=Partitioner.PARTITION_BY,
+        choices=('date', 'field', 'source', 'shard'),
+        help='Output partitions: processing date directories ({year}/{month}/{day}), the value of a record field '
+             '(field=value), the source (source=name) or a hash shard of record fields (shard=n) '
+             '(default=%(default)s).')
+    parser.add_argument(
+        '--partition-fields',
+        default=None,
+        help='Comma separated output fields --partition-by field or shard partitions by, e.g. created_at '
+             '(default=%(default)s).')
+    parser.add_argument(
+        '--shards',
+        default=None,
+        type=int,
+        help='Number of shards for --partition-by shard (default=%(default)s).')
+    parser.add_argument(
+        '--max-file-size',
+        default=None,
+        type=int,
+        help='Bytes after which ndjson and columnar output files are rolled over to a new file (default=%(default)s).')
+    parser.add_argument(
+        '--max-file-records',
+        default=None,
+        type=int,
+        help='Records after which ndjson and columnar output files are rolled over to a new file '
+             '(default=%(default)s).')
+    parser.add_argument(
+        '--encoder',
+        default='auto',
+        choices=('auto', 'orjson', 'ujson', 'json'),
+        help='JSON encoder: orjson and ujson write compact UTF-8, json writes ASCII as the standard library does; '
+             'auto picks the fastest installed (default=%(default)s).')
+    parser.add_argument(
+        '--writers',
+        default=0,
+        type=int,
+        help='Number of threads writing output while records are processed, 0 writes on the main thread '
+             '(default=%(default)s).')
+    parser.add_argument(
+        '--write-queue',
+        default=Loader.QUEUE_SIZE,
+        type=int,
+        help='Write jobs queued per writer thread before processing waits for writes (default=%(default)s).')
+    parser.add_argument(
+        '--index-file',
+        default=None,
+        help=f'SQLite index of processed input files (default=<output dir>/{INDEX_FILE}).')
+    parser.add_argument(
+        '--index-retention',
+        default=INDEX_RETENTION_DAYS,
+        type=int,
+        help='Days to keep index entries of removed input files, see --hash-files (default=%(default)s).')
+    parser.add_argument(
+        '--hash-files',
+        default=False,
+        action='store_true',
+        help='Also skip input files whose content was already processed under another name (default=%(default)s).')
+    parser.add_argument(
+        '--checkpoint-rows',
+        default=Extractor.CHECKPOINT_ROWS,
+        type=int,
+        help='Rows between extraction checkpoints an interrupted run resumes from, 0 disables (default=%(default)s).')
+    parser.add_argument(
+        '--incremental',
+        default=False,
+        action='store_true',
+        help='Treat input files as append-only: when a processed file grows, only extract the rows appended since and '
+             'continue output naming (default=%(default)s).')
+    parser.add_argument(
+        '--dedup',
+        default=None,
+        help='Comma separated output fields, e.g. email: drop records whose normalized values of these fields were '
+             'seen before, in any file and run (default=%(default)s).')
+    parser.add_argument(
+        '--dedup-file',
+        default=None,
+        help=f'SQLite index of keys seen by --dedup, with its Bloom filter next to it '
+             f'(default=<output dir>/{DEDUP_FILE}).')
+    parser.add_argument(
+        '--dedup-capacity',
+        default=Deduplicator.CAPACITY,
+        type=int,
+        help='Keys the --dedup Bloom filter is sized for, more only make it less selective (default=%(default)s).')
+    parser.add_argument(
+        '--metrics-period',
+        default=METRICS_PERIOD,
+        type=float,
+        help='Seconds between metrics log lines during a run, one is also logged after each run (default=%(default)s).')
+    parser.add_argument(
+        '--metrics-file',
+        nargs='?',
+        const='',
+        default=None,
+        help=f'Write metrics in Prometheus text format to file, <output dir>/{METRICS_FILE} if no file is given '
+             f'(default=%(default)s).')
     args = parser.parse_args()
 
+    # state files live next to the output unless given
+    args.index_file = args.index_file or os.path.join(args.output_dir, INDEX_FILE)
+    args.dedup_file = args.dedup_file or os.path.join(args.output_dir, DEDUP_FILE)
+    if args.metrics_file == '':
+        args.metrics_file = os.path.join(args.output_dir, METRICS_FILE)
+    try:
+        partitioner = Partitioner.get_instance(
+            args.partition_by,
+            fields=args.partition_fields.split(',') if args.partition_fields else None,
+            shards=args.shards)
+    except ValueError as error:
+        parser.error(str(error))
+
     # start up
     logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT)
     logger = logging.getLogger('pipeline')
     logger.info('start')
     logger.debug(f'args={args}')
+    file_index = FileIndex(
+        args.index_file,
+        hash_files=args.hash_files,
+        retention=args.index_retention * 24 * 60 * 60)
+    extractors.set_file_cache(file_index)
+    options = dict(
+        file_index=file_index,
+        checkpoint_rows=args.checkpoint_rows,
+        use_mmap=args.mmap,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        output_format=args.output_format,
+        batch_size=args.batch_size,
+        writers=args.writers,
+        write_queue=args.write_queue,
+        encoder=args.encoder,
+        incremental=args.incremental,
+        output_dir=args.output_dir,
+        partitioner=partitioner,
+        max_file_size=args.max_file_size,
+        max_file_records=args.max_file_records,
+        dedup=Deduplicator(args.dedup.split(','), args.dedup_file, args.dedup_capacity) if args.dedup else None,
+        metrics=Metrics(args.metrics_period, args.metrics_file))
     if args.file_path:
-        main(log=logger, input_dir=args.input_dir, file_path=args.file_path)
+        main(log=logger, input_dir=args.input_dir, file_path=args.file_path, **options)
     else:
         if not (os.path.exists(args.input_dir) and os.path.isdir(args.input_dir)):
             logger.error(f"input dir '{args.input_dir}' does not exist or is not a directory")
             exit(1)
-        while True:
-            main(log=logger, input_dir=args.input_dir)
-            time.sleep(args.time_period)
+        watcher = Watcher.get_instance(args.input_dir, args.time_period, args.debounce, poll=args.poll)
+        for file_paths in watcher.watch():
+            if file_paths:
+                main(log=logger, input_dir=args.input_dir, file_paths=file_paths, **options)
+            else:
+                logger.info('nothing extracted')
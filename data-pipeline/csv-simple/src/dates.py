@@ -0,0 +1,68 @@
+import re
+from datetime import date
+from functools import lru_cache
+
+# same directive patterns as datetime.strptime, so compiled templates accept exactly the same input
+DIRECTIVES = {
+    'd': r'(?P<d>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])',
+    'm': r'(?P<m>1[0-2]|0[1-9]|[1-9])',
+    'y': r'(?P<y>\d\d)',
+    'Y': r'(?P<Y>\d\d\d\d)',
+}
+CACHE_SIZE = 4096
+
+
+def compile_template(template):
+    """Compile a strptime template using %d, %m, %y and %Y directives into a regular expression."""
+    pattern = []
+    parts = iter(template)
+    for char in parts:
+        if char == '%':
+            directive = next(parts)
+            if directive not in DIRECTIVES:
+                raise ValueError(f"'%{directive}' is not a supported directive in '{template}'")
+            pattern.append(DIRECTIVES[directive])
+        else:
+            pattern.append(re.escape(char))
+    return re.compile(''.join(pattern), re.IGNORECASE)
+
+
+class DateParser(object):
+    """
+    Parse date strings against a tuple of strptime templates.
+
+    Templates are compiled to regular expressions once, the last matching template is tried first and
+    results (including misses) are kept in a bounded LRU cache.
+    """
+
+    def __init__(self, templates, cache_size=CACHE_SIZE):
+        self.templates = templates
+        self._patterns = [compile_template(template) for template in templates]
+        self._last = 0
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, value):
+        patterns = self._patterns
+        count = len(patterns)
+        for offset in range(count):
+            index = (self._last + offset) % count
+            match = patterns[index].fullmatch(value)
+            if not match:
+                continue
+            parsed = self._to_date(match.groupdict())
+            if parsed:
+                self._last = index
+                return parsed
+        return None
+
+    @staticmethod
+    def _to_date(fields):
+        if 'Y' in fields:
+            year = int(fields['Y'])
+        else:
+            year = int(fields['y'])
+            year += 2000 if year <= 68 else 1900
+        try:
+            return date(year, int(fields['m']), int(fields['d'].strip()))
+        except ValueError:
+            return None
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import sqlite3
+import struct
+
+
+class BloomFilter(object):
+    """
+    Bloom filter over 16 byte digests, its bits memory mapped from file_path (anonymous memory if None).
+
+    Bit positions are derived from the digest by double hashing, so keys are hashed only once.
+    """
+
+    def __init__(self, capacity, error_rate=0.01, file_path=None):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.file_path = file_path
+        self.created = True
+        length = (self.size + 7) // 8
+        if file_path is None:
+            self._file = None
+            self._bits = mmap.mmap(-1, length)
+        else:
+            self.created = not os.path.exists(file_path) or os.path.getsize(file_path) != length
+            self._file = open(file_path, 'r+b' if not self.created else 'w+b')
+            if self.created:
+                self._file.truncate(length)
+            self._bits = mmap.mmap(self._file.fileno(), length)
+
+    def _positions(self, digest):
+        size = self.size
+        h1, h2 = struct.unpack('<QQ', digest)
+
+        # reduced first, so the arithmetic stays on small ints
+        position, step = h1 % size, h2 % size or 1
+        positions = []
+        for _ in range(self.hashes):
+            positions.append(position)
+            position += step
+            if position >= size:
+                position -= size
+        return positions
+
+    def __contains__(self, digest):
+        bits = self._bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] >> (position & 7) & 1:
+                return False
+        return True
+
+    def add(self, digest):
+        """Add digest, return whether it may have been added before."""
+        bits = self._bits
+        present = True
+        for position in self._positions(digest):
+            index, mask = position >> 3, 1 << (position & 7)
+            byte = bits[index]
+            if not byte & mask:
+                bits[index] = byte | mask
+                present = False
+        return present
+
+    def flush(self):
+        if self._file is not None:
+            self._bits.flush()
+
+    def close(self):
+        self.flush()
+        self._bits.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class Deduplicator(object):
+    """
+    Drop records whose key, the normalized values of fields, was seen before (in this or an earlier run). Records
+    with a null key field are kept.
+
+    Keys are kept as 16 byte digests: a Bloom filter answers most lookups of new keys in memory, possible duplicates
+    are checked exactly against the digests stored in SQLite at db_path. The Bloom filter is memory mapped from
+    db_path + '.bloom' and rebuilt from the database if it is missing; with more than capacity keys it only gets
+    less selective.
+
+    Keys of new records are committed once the loader asked for the record after one carrying a checkpoint, that is
+    once the loader committed the checkpoint, and at the end of each stream; records extracted again after an
+    interruption are therefore not mistaken for duplicates of themselves. Keys are rolled back instead when the
+    loader dropped the checkpoint or completed marker, after failed writes.
+    """
+    CAPACITY = 10 * 1000 * 1000
+    ERROR_RATE = 0.01
+    PENDING_SIZE = 10000
+
+    def __init__(self, fields, db_path=':memory:', capacity=None, error_rate=None):
+        self.fields = tuple(fields)
+        self.db_path = db_path
+        self.log = logging.getLogger(f'pipeline.dedup.{self.__class__.__name__}')
+        self.dropped = 0
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute("CREATE TABLE IF NOT EXISTS keys (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+        self._filter = BloomFilter(
+            capacity or self.CAPACITY,
+            error_rate or self.ERROR_RATE,
+            None if db_path == ':memory:' else f'{db_path}.bloom')
+        if self._filter.created:
+            self._rebuild_filter()
+        self._pending = set()
+        self._in_transaction = False
+
+    def _rebuild_filter(self):
+        count = 0
+        for digest, in self._connection.execute("SELECT digest FROM keys"):
+            self._filter.add(digest)
+            count += 1
+        if count:
+            self.log.info(f'rebuilt filter keys={count}')
+        self._filter.flush()
+
+    def key(self, data):
+        """Return the digest of the record key, None if a key field is null."""
+        values = []
+        for field in self.fields:
+            value = data.get(field)
+            if value is None:
+                return None
+            values.append(str(value).strip().lower())
+        return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=16).digest()
+
+    def is_duplicate(self, data):
+        digest = self.key(data)
+        if digest is None:
+            return False
+        if self._filter.add(digest) and (digest in self._pending or self._connection.execute(
+                "SELECT 1 FROM keys WHERE digest = ?", (digest,)).fetchone()):
+            return True
+        self._pending.add(digest)
+        if len(self._pending) >= self.PENDING_SIZE:
+            self._write_pending()
+        return False
+
+    def filter(self, records):
+        """Yield records which are not duplicates."""
+        for record in records:
+            if record.data is not None and self.is_duplicate(record.data):
+                self.dropped += 1
+                if not (record.checkpoint or record.resumed):
+                    continue
+
+                # the loader still needs the checkpoint
+                record.data = None
+            marker = record.checkpoint or record.completed
+            yield record
+
+            # the loader is done with the record, including committing its checkpoint or completed file
+            if record.checkpoint or record.completed:
+                self.commit()
+            elif marker:
+                self.rollback()
+        self.commit()
+
+    def _write_pending(self):
+        if not self._in_transaction:
+            self._connection.execute('BEGIN')
+            self._in_transaction = True
+
+        # sorted, inserts into the primary key B-tree are faster in order
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO keys (digest) VALUES (?)", ((digest,) for digest in sorted(self._pending)))
+        self._pending.clear()
+
+    def commit(self):
+        if self._pending:
+            self._write_pending()
+        if self._in_transaction:
+
+            # filter bits of committed keys must not get lost
+            self._filter.flush()
+            self._connection.execute('COMMIT')
+            self._in_transaction = False
+
+    def rollback(self):
+        """Forget keys not committed yet, their records are extracted again."""
+        self._pending.clear()
+        if self._in_transaction:
+            self._connection.execute('ROLLBACK')
+            self._in_transaction = False
+
+    def close(self):
+        self.commit()
+        self._filter.close()
+        self._connection.close()
@@ -0,0 +1,103 @@
+import json
+from datetime import date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class Encoder(object):
+    """
+    Serialize records to JSON bytes with the standard library.
+
+    Dates are formatted with date_format through the encoder's default hook, once per distinct value, so records are
+    serialized as they are instead of being copied to replace their dates first.
+    """
+    ENCODER = 'json'
+    AVAILABLE = True
+    PREFERENCE = ('orjson', 'ujson', 'json')
+    DATE_FORMAT = '%a %d-%b-%Y'
+    CACHE_SIZE = 4096
+
+    # encoder name -> encoder class
+    _registry = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Encoder._registry[cls.ENCODER] = cls
+
+    def __init__(self, date_format=None):
+        self.date_format = date_format or self.DATE_FORMAT
+        self._dates = {}
+        self._encoder = json.JSONEncoder(default=self.default)
+
+    @classmethod
+    def get_class(cls, encoder=None):
+        """Return the named encoder class if it is installed, the fastest one installed for None or 'auto'."""
+        for name in cls.PREFERENCE if encoder in (None, 'auto') else (encoder,):
+            encoder_class = cls._registry.get(name)
+            if encoder_class and encoder_class.AVAILABLE:
+                return encoder_class
+        return None
+
+    @classmethod
+    def get_instance(cls, encoder=None, **kwargs):
+        encoder_class = cls.get_class(encoder)
+        return encoder_class(**kwargs) if encoder_class else None
+
+    def format_date(self, value):
+        formatted = self._dates.get(value)
+        if formatted is None:
+            formatted = value.strftime(self.date_format)
+            if len(self._dates) < self.CACHE_SIZE:
+                self._dates[value] = formatted
+        return formatted
+
+    def default(self, value):
+        if isinstance(value, date):
+            return self.format_date(value)
+        raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+    def encode(self, item):
+        # ASCII only, non ASCII characters are escaped
+        return self._encoder.encode(item).encode('ascii')
+
+    def encode_line(self, item):
+        return self.encode(item) + b'\n'
+
+
+Encoder._registry[Encoder.ENCODER] = Encoder
+
+
+class OrjsonEncoder(Encoder):
+    """Serialize with orjson: compact UTF-8 output."""
+    ENCODER = 'orjson'
+    AVAILABLE = orjson is not None
+
+    def __init__(self, date_format=None):
+        super(OrjsonEncoder, self).__init__(date_format)
+
+        # orjson formats dates itself unless they are passed through to default
+        self._option = orjson.OPT_PASSTHROUGH_DATETIME
+        self._line_option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_APPEND_NEWLINE
+
+    def encode(self, item):
+        return orjson.dumps(item, default=self.default, option=self._option)
+
+    def encode_line(self, item):
+        return orjson.dumps(item, default=self.default, option=self._line_option)
+
+
+class UjsonEncoder(Encoder):
+    """Serialize with ujson: compact UTF-8 output."""
+    ENCODER = 'ujson'
+    AVAILABLE = ujson is not None
+
+    def encode(self, item):
+        return ujson.dumps(item, default=self.default, ensure_ascii=False).encode()
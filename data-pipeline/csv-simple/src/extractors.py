@@ -1,15 +1,34 @@
+import bz2
+import gzip
 import logging
-from csv import DictReader
+import lzma
+import mmap
+from csv import reader
 import os
+import zipfile
 
-__file_cache = set()
+from src.file_index import FileIndex
+from src.records import Record, Source
+
+__file_cache = FileIndex()
+
+
+def set_file_cache(file_index):
+    global __file_cache
+    __file_cache = file_index
 
 
 def _is_file_valid(path, filename):
-    return os.path.isfile(os.path.join(path, filename)) and filename not in __file_cache
+    file_path = os.path.join(path, filename)
+    return os.path.isfile(file_path) and file_path not in __file_cache
+
+
+def compact_file_cache_if_due():
+    return __file_cache.compact_if_due()
 
 
 def scan_input_dir(input_dir, validator_function=_is_file_valid):
+    compact_file_cache_if_due()
     return [
         os.path.join(input_dir, f)
         for f
@@ -18,54 +37,385 @@ def scan_input_dir(input_dir, validator_function=_is_file_valid):
     ]
 
 
-def with_file_cache(f):
-    def wrapper(self, *args, **kwargs):
-        r = f(self, *args, **kwargs)
-        if r:
-            __file_cache.add(self.filename)
-        return r
-    return wrapper
+def get_checkpoint(file_path):
+    return __file_cache.get_checkpoint(file_path)
 
 
 class Extractor(object):
+    """
+    Base class of extractors, subclasses register under FILE_EXTENSION when they are defined.
+
+    FILE_EXTENSION may be compound (.csv.gz), the longest registered suffix of a file name wins.
+
+    In incremental mode files are taken as append-only: the last row extracted carries a checkpoint which is kept
+    after the file is processed, so when the file grows only the rows appended since are extracted.
+    """
     FILE_EXTENSION = None
+    FILE_TYPE = None
+    CHECKPOINT_ROWS = 100000
     file_path = None
+    byte_range = None
+    checkpoint_rows = None
+    use_mmap = False
+    columns = None
+    incremental = False
+    bytes_read = 0
     log = None
 
-    def __init__(self, file_path):
+    # file extension -> extractor class
+    _registry = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.FILE_EXTENSION:
+            Extractor._registry[cls.FILE_EXTENSION] = cls
+
+    def __init__(self, file_path, byte_range=None, checkpoint_rows=None, use_mmap=False, columns=None,
+                 incremental=False):
         self.file_path = file_path
+        self.byte_range = byte_range
+        self.checkpoint_rows = self.CHECKPOINT_ROWS if checkpoint_rows is None else checkpoint_rows
+        self.use_mmap = use_mmap
+        self.columns = columns
+        self.incremental = incremental
         self.log = logging.getLogger(f'pipeline.extractors.{self.__class__.__name__}')
 
     @classmethod
-    def get_instance(cls, file_path):
-        _, extension = os.path.splitext(file_path)
-        if extension == cls.FILE_EXTENSION:
-            return cls(file_path)
-        for sub in cls.__subclasses__():
-            return sub.get_instance(file_path)
+    def get_class(cls, file_path):
+        parts = os.path.basename(file_path).split('.')
+        for i in range(1, len(parts)):
+            extractor_class = cls._registry.get('.' + '.'.join(parts[i:]))
+            if extractor_class:
+                return extractor_class
+        return None
+
+    @classmethod
+    def get_instance(cls, file_path, **kwargs):
+        extractor_class = cls.get_class(file_path)
+        return extractor_class(file_path, **kwargs) if extractor_class else None
 
     @property
     def filename(self):
         return os.path.split(self.file_path)[1]
 
-    @with_file_cache
     def extract(self):
+        """Yield records, return whether the file was extracted completely."""
         return self._extract()
 
+    def byte_ranges(self, chunk_size):
+        return [self.byte_range]
+
     def _extract(self):
         raise NotImplementedError
 
 
 class CsvExtractor(Extractor):
     FILE_EXTENSION = '.csv'
+    FILE_TYPE = 'csv'
+
+    ENCODING = 'utf-8'
+    BLOCK_SIZE = 1024 * 1024
+    position = None
+
+    def byte_ranges(self, chunk_size):
+        """
+        Split file body into ranges of about chunk_size bytes, aligned on record ends.
+
+        Quoted fields may contain newlines, so ranges end at the first newline after chunk_size bytes outside quotes:
+        the file is scanned once counting quotes, doubled (escaped) quotes keep the count even. A file without rows
+        still gets a single, empty range, so that it is extracted and completed once.
+        """
+        ranges = []
+        with open(self.file_path, 'rb') as f:
+            f.readline()
+            start = position = f.tell()
+            size = os.fstat(f.fileno()).st_size
+            target = start + chunk_size
+            quoted = False
+            while target < size:
+                block = f.read(self.BLOCK_SIZE)
+                if not block:
+                    break
+                block_end = position + len(block)
+                offset = 0
+                while target < block_end:
+
+                    # quotes up to the target, then newlines until one is outside quotes
+                    cut = max(target - position, offset)
+                    quoted ^= block.count(b'"', offset, cut) & 1
+                    offset = cut
+                    newline = block.find(b'\n', offset)
+                    while newline >= 0:
+                        quoted ^= block.count(b'"', offset, newline) & 1
+                        offset = newline + 1
+                        if not quoted:
+                            break
+                        newline = block.find(b'\n', offset)
+                    if newline < 0:
+
+                        # the search goes on in the next block
+                        target = block_end
+                        break
+                    stop = position + offset
+                    ranges.append((start, stop))
+                    start = stop
+                    target = stop + chunk_size
+                quoted ^= block.count(b'"', offset) & 1
+                position = block_end
+            if start < size or not ranges:
+                ranges.append((start, size))
+        return ranges
+
+    def _open(self):
+        return open(self.file_path, 'rb')
+
+    def _source_file(self):
+        """Name of the file records come from, output is named after it."""
+        return self.filename
+
+    def _input_size(self):
+        return os.path.getsize(self.file_path)
+
+    def _read_lines(self, byte_range):
+        """Yield header and lines within byte_range, keeping self.position at the end of the last line read."""
+        with self._open() as f:
+            yield f.readline().decode(self.ENCODING)
+            start, stop = byte_range or (f.tell(), None)
+            f.seek(start)
+            self.position = start
+            for line in f:
+                if stop is not None and self.position >= stop:
+                    break
+
+                # a line still being appended is left for the next run
+                if self.incremental and not line.endswith(b'\n'):
+                    break
+                self.position += len(line)
+                try:
+                    text = line.decode(self.ENCODING)
+                except UnicodeDecodeError as error:
+                    self.log.warning(f'skipped line path={self.file_path} offset={self.position - len(line)} {error}')
+                    continue
+                yield text
+
+    def _read_rows_mmap(self, byte_range):
+        """
+        Yield header and rows tokenized straight from a memory map of the file.
+
+        Only fields of header entries in columns (all if None) are decoded to str, the header is reduced to match.
+        Rows containing quotes fall back to the csv module, quoted fields may span lines up to the end of byte_range,
+        which must start on a record (see byte_ranges).
+        """
+        with open(self.file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                find = buffer.find
+                end = find(b'\n')
+                end = size if end < 0 else end + 1
+                header = next(reader([buffer[:end].decode(self.ENCODING)]), [])
+                indexes = [i for i, key in enumerate(header) if self.columns is None or key.strip() in self.columns]
+                yield tuple(header[i] for i in indexes)
+                position, stop = byte_range or (end, None)
+                appending = self.incremental and stop is None
+                if stop is None:
+                    stop = buffer.rfind(b'\n') + 1 if appending else size
+                while position < stop:
+
+                    # split a block of whole lines at once, position is the start of the next line
+                    block_end = find(b'\n', min(position + self.BLOCK_SIZE, stop) - 1)
+                    block_end = size if block_end < 0 else block_end + 1
+                    lines = buffer[position:block_end].split(b'\n')
+                    if not lines[-1]:
+                        lines.pop()
+                    index = 0
+                    while index < len(lines):
+                        line = lines[index]
+                        index += 1
+                        line_start = position
+                        position += len(line) + 1
+                        quoted = b'"' in line
+                        while quoted and line.count(b'"') % 2 and position < stop:
+
+                            # quoted field spanning lines
+                            if index < len(lines):
+                                following = lines[index]
+                                index += 1
+                            else:
+                                following_end = find(b'\n', position)
+                                following_end = size if following_end < 0 else following_end
+                                following = buffer[position:following_end]
+                            position += len(following) + 1
+                            line += b'\n' + following
+                        if quoted and line.count(b'"') % 2:
+                            if appending:
+
+                                # a record still being appended is left for the next run
+                                return
+
+                            # never into the next range, the rows swallowed are reported
+                            self.log.warning(
+                                f'unterminated quoted field path={self.file_path} offset={line_start} '
+                                f'bytes={len(line)}')
+                        self.position = min(position, size)
+                        try:
+                            if quoted:
+                                fields = next(reader(line.decode(self.ENCODING).splitlines(keepends=True)), [])
+                                yield [fields[i] for i in indexes if i < len(fields)]
+                            else:
+                                fields = line.rstrip(b'\r').split(b',')
+                                if fields == [b'']:
+                                    continue
+
+                                # indexes are ascending, so missing trailing fields keep positions
+                                yield [fields[i].decode(self.ENCODING) for i in indexes if i < len(fields)]
+                        except UnicodeDecodeError as error:
+                            self.log.warning(f'skipped line path={self.file_path} offset={line_start} {error}')
+
+    def _resume(self):
+        """Return checkpoint (byte offset, row number, loader state) to continue whole file extraction from."""
+        if self.byte_range is not None or not (self.checkpoint_rows or self.incremental):
+            return None
+        checkpoint = get_checkpoint(self.file_path)
+        size = self._input_size()
+        if checkpoint and (size is None or checkpoint[0] <= size):
+            self.log.info(f'resuming path={self.file_path} offset={checkpoint[0]} row={checkpoint[1]}')
+            return checkpoint
+        return None
 
     def _extract(self):
+        count = start = 0
         try:
-            with open(self.file_path, 'r') as f:
-                reader = DictReader(f)
-                data = [dict(data=row, file_type=self.FILE_EXTENSION[1:], file=self.filename) for row in reader]
-                self.log.debug(f'extracted path={self.file_path} items={len(data)}')
-            return data
+            resumed = self._resume()
+            byte_range = (resumed[0], None) if resumed else self.byte_range
+            row_number = resumed[1] if resumed else 0
+            start = byte_range[0] if byte_range else 0
+            checkpoint_rows = self.checkpoint_rows if self.byte_range is None else 0
+            incremental = self.incremental and self.byte_range is None
+            last = None
+            if self.use_mmap:
+                rows = self._read_rows_mmap(byte_range)
+            else:
+                rows = reader(self._read_lines(byte_range))
+            source = Source(self.file_path, self.FILE_TYPE, tuple(next(rows, ())), self._source_file())
+            for row in rows:
+                if not row:
+                    continue
+                row_number += 1
+                record = Record(source, row)
+                if resumed:
+                    record.resumed = resumed
+                    resumed = None
+                if checkpoint_rows and row_number % checkpoint_rows == 0:
+                    record.checkpoint = (self.file_path, self.position, row_number)
+                if incremental:
+
+                    # the last row is held back to carry the checkpoint the next run continues from
+                    if last:
+                        yield last[0]
+                        count += 1
+                    last = (record, self.position, row_number)
+                    continue
+                yield record
+                count += 1
+            if last:
+                record, position, row = last
+                record.checkpoint = (self.file_path, position, row)
+                yield record
+                count += 1
         except Exception as error:
             self.log.exception(error)
-            return None
+            return False
+        finally:
+            self.bytes_read = (self.position or start) - start
+        self.log.debug(f'extracted path={self.file_path} range={self.byte_range} items={count}')
+        return True
+
+
+class CompressedCsvExtractor(CsvExtractor):
+    """
+    Base class for compressed CSV files, decompressed while they are read.
+
+    Offsets are positions in the decompressed stream: files are not split into byte ranges, resuming from a
+    checkpoint decompresses up to it and memory mapping does not apply.
+    """
+    FILE_EXTENSION = None
+    OPEN = None
+
+    def __init__(self, file_path, byte_range=None, checkpoint_rows=None, use_mmap=False, columns=None,
+                 incremental=False):
+        super(CompressedCsvExtractor, self).__init__(
+            file_path, byte_range, checkpoint_rows, False, columns, incremental)
+
+    def byte_ranges(self, chunk_size):
+        return [self.byte_range]
+
+    def _open(self):
+        return self.OPEN(self.file_path, 'rb')
+
+    def _source_file(self):
+        return self.filename[:-len(self.FILE_EXTENSION)] + CsvExtractor.FILE_EXTENSION
+
+    def _input_size(self):
+        return None
+
+
+class GzipCsvExtractor(CompressedCsvExtractor):
+    FILE_EXTENSION = '.csv.gz'
+    OPEN = staticmethod(gzip.open)
+
+
+class Bz2CsvExtractor(CompressedCsvExtractor):
+    FILE_EXTENSION = '.csv.bz2'
+    OPEN = staticmethod(bz2.open)
+
+
+class XzCsvExtractor(CompressedCsvExtractor):
+    FILE_EXTENSION = '.csv.xz'
+    OPEN = staticmethod(lzma.open)
+
+
+class ZipCsvExtractor(CompressedCsvExtractor):
+    """
+    Extract each CSV member of a zip archive as an input of its own, named after the member.
+
+    Members are read one after another from the archive, there are no checkpoints within an archive: an archive
+    interrupted is extracted again from its start, and it is never taken as append-only.
+    """
+    FILE_EXTENSION = '.zip'
+    OPEN = None
+    _archive = None
+    _member = None
+
+    def __init__(self, file_path, byte_range=None, checkpoint_rows=None, use_mmap=False, columns=None,
+                 incremental=False):
+        super(ZipCsvExtractor, self).__init__(file_path, byte_range, 0, False, columns, False)
+
+    def _open(self):
+        return self._archive.open(self._member)
+
+    def _source_file(self):
+        return os.path.basename(self._member.filename)
+
+    def _resume(self):
+        return None
+
+    def _extract(self):
+        completed = True
+        bytes_read = 0
+        try:
+            with zipfile.ZipFile(self.file_path) as archive:
+                self._archive = archive
+                for member in archive.infolist():
+                    if member.is_dir() or Extractor.get_class(member.filename) is not CsvExtractor:
+                        continue
+                    self._member = member
+                    completed = (yield from super(ZipCsvExtractor, self)._extract()) and completed
+                    bytes_read += self.bytes_read
+        except (OSError, zipfile.BadZipFile) as error:
+            self.log.exception(error)
+            return False
+        finally:
+            self.bytes_read = bytes_read
+        return completed
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class FileIndex(object):
+    """
+    Persistent index of processed input files in SQLite.
+
+    Files are keyed by absolute path, size and modification time; with hash_files a file whose key changed is still
+    considered processed when its content digest is known. Entries of existing files are kept whatever their age,
+    so that they are never processed again; compact() evicts entries of files which no longer exist, once processed
+    more than retention seconds ago (immediately when retention is None).
+
+    The index also keeps extraction checkpoints of files not completely processed yet, and of processed append-only
+    files (see keep_checkpoint).
+    """
+
+    def __init__(self, db_path=':memory:', hash_files=False, retention=None, compact_period=24 * 60 * 60):
+        self.db_path = db_path
+        self.hash_files = hash_files
+        self.retention = retention
+        self.compact_period = compact_period
+        self.log = logging.getLogger(f'pipeline.file_index.{self.__class__.__name__}')
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+              path TEXT PRIMARY KEY,
+              size INTEGER NOT NULL,
+              mtime_ns INTEGER NOT NULL,
+              digest TEXT,
+              processed_at REAL NOT NULL
+            )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS files_digest ON files (digest)")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+              path TEXT PRIMARY KEY,
+              offset INTEGER NOT NULL,
+              row INTEGER NOT NULL,
+              state INTEGER,
+              updated_at REAL NOT NULL
+            )""")
+        self._digests = {}
+        self._last_compacted = None
+
+    @staticmethod
+    def _key(file_path):
+        stat = os.stat(file_path)
+        return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+    def _digest(self, key):
+        digest = self._digests.get(key)
+        if digest is None:
+            hasher = hashlib.blake2b()
+            with open(key[0], 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    hasher.update(block)
+            digest = self._digests[key] = hasher.hexdigest()
+        return digest
+
+    def __contains__(self, file_path):
+        key = self._key(file_path)
+        row = self._connection.execute(
+            "SELECT 1 FROM files WHERE path = ? AND size = ? AND mtime_ns = ?", key).fetchone()
+        if row:
+            return True
+        if self.hash_files:
+            row = self._connection.execute(
+                "SELECT 1 FROM files WHERE digest = ? LIMIT 1", (self._digest(key),)).fetchone()
+            return bool(row)
+        return False
+
+    def add(self, file_path, keep_checkpoint=False):
+        key = self._key(file_path)
+        digest = self._digest(key) if self.hash_files else None
+        self._digests.pop(key, None)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, digest, processed_at) VALUES (?, ?, ?, ?, ?)",
+            key + (digest, time.time()))
+        if not keep_checkpoint:
+            self.clear_checkpoint(file_path)
+
+    def get_checkpoint(self, file_path):
+        """Return (byte offset, row number, loader state) of the last checkpoint, None if there is none."""
+        checkpoint = self._connection.execute(
+            "SELECT offset, row, state FROM checkpoints WHERE path = ?", (os.path.abspath(file_path),)).fetchone()
+        if checkpoint and isinstance(checkpoint[2], str):
+            checkpoint = checkpoint[:2] + (json.loads(checkpoint[2]),)
+        return checkpoint
+
+    def set_checkpoint(self, file_path, offset, row, state=None):
+        """Store a checkpoint, loader state is an int or JSON serializable."""
+        if state is not None and not isinstance(state, int):
+            state = json.dumps(state)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO checkpoints (path, offset, row, state, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (os.path.abspath(file_path), offset, row, state, time.time()))
+
+    def clear_checkpoint(self, file_path):
+        self._connection.execute("DELETE FROM checkpoints WHERE path = ?", (os.path.abspath(file_path),))
+
+    def compact(self):
+        """Evict entries of files which no longer exist, files processed within retention are kept."""
+        evicted = 0
+        selects = (
+            ('files', "SELECT path FROM files WHERE processed_at <= ?", (time.time() - (self.retention or 0),)),
+            ('checkpoints', "SELECT path FROM checkpoints", ()),
+        )
+        for table, select, parameters in selects:
+            missing = [(path,) for path, in self._connection.execute(select, parameters) if not os.path.exists(path)]
+            if missing:
+                self._connection.executemany(f"DELETE FROM {table} WHERE path = ?", missing)
+                evicted += len(missing)
+        if evicted:
+            self._connection.execute('VACUUM')
+        self._digests.clear()
+        self._last_compacted = time.monotonic()
+        self.log.debug(f'compacted index={self.db_path} evicted={evicted}')
+        return evicted
+
+    def compact_if_due(self):
+        if self._last_compacted is None or time.monotonic() - self._last_compacted >= self.compact_period:
+            return self.compact()
+        return 0
+
+    def close(self):
+        self._connection.close()
@@ -1,41 +1,572 @@
-import json
 import logging
 import os
-from collections import defaultdict
-from datetime import date, datetime
-from pathlib import Path
+import struct
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date
+from queue import Queue
+
+from src.encoders import Encoder
+from src.partitions import Partitioner
+
+
+class WriteBuffer(object):
+    """Fixed size bytes buffer in front of a binary file, filled in place and reused after each flush."""
+    __slots__ = ('file', '_buffer', '_view', '_position')
+
+    def __init__(self, file, size):
+        self.file = file
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._position = 0
+
+    def write(self, data):
+        position = self._position
+        end = position + len(data)
+        if end > len(self._buffer):
+            self.flush()
+            position, end = 0, len(data)
+            if end > len(self._buffer):
+                return self.file.write(data)
+        self._buffer[position:end] = data
+        self._position = end
+        return end - position
+
+    def flush(self):
+        if self._position:
+            self.file.write(self._view[:self._position])
+            self._position = 0
+        self.file.flush()
+
+    def tell(self):
+        return self.file.tell() + self._position
+
+    def close(self):
+        self.flush()
+        self._view.release()
+        self.file.close()
+
+
+class OutputFile(object):
+    """Output file of a source in a partition, rolled over to the next file once it is full."""
+    __slots__ = ('partition', 'source_name', 'roll', 'size', 'records', 'file')
+
+    def __init__(self, partition, source_name, roll=1, size=0, records=0):
+        self.partition = partition
+        self.source_name = source_name
+        self.roll = roll
+        self.size = size
+        self.records = records
+        self.file = None
+
+    def state(self):
+        return [self.roll, self.size, self.records]
 
 
 class Loader(object):
+    """
+    Dump each record into its own JSON file.
+
+    Output goes to partitions of output_dir, directories chosen per record by partitioner (by processing date by
+    default, see src.partitions); partition directories are created once and kept open.
+
+    Records carrying an extraction checkpoint are sync points: once everything dumped so far for the source is
+    written, the checkpoint is committed to checkpoints together with the loader state needed to continue output
+    naming. Records carrying a resumed checkpoint restore that state. Records without data only carry markers.
+
+    Records marking a completely extracted file are sync points for all output: once it is written, the file is
+    recorded as processed in checkpoints, so a crash before never leaves a processed file without output.
+
+    Once a write of a source failed, checkpoints and completion of its input file are no longer committed, the file
+    is extracted again from its last checkpoint by the next run; the markers are cleared on their records, so stages
+    upstream see them dropped (see src.dedup).
+
+    With writers, file writes run on that many writer threads fed by bounded queues of queue_size jobs each, so
+    extraction and processing go on while output is written; a full queue blocks dump, pushing back on the upstream
+    stages. Files written whole are independent, their writes are spread over all writers in turn; loaders appending
+    to files (APPEND_WRITES) send the writes of a source to the same writer, keeping their order. Sync points wait
+    for all queued writes.
+
+    Records are serialized by the named encoder, the fastest one installed by default (see src.encoders).
+    """
+    OUTPUT_FORMAT = 'json'
+    OUTPUT_DIR = 'output'
+    FILE_EXTENSION = '.json'
+    FILE_HEADER = b''
     DATE_FORMAT = '%a %d-%b-%Y'
+    BUFFER_SIZE = 1024 * 1024
+    QUEUE_SIZE = 1000
+    MAX_OPEN_FILES = 16
+    APPEND_WRITES = False
 
-    def __init__(self):
+    # output format -> loader class
+    _registry = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.OUTPUT_FORMAT:
+            Loader._registry[cls.OUTPUT_FORMAT] = cls
+
+    def __init__(self, batch_size=None, checkpoints=None, writers=0, queue_size=None, encoder=None, output_dir=None,
+                 partitioner=None, max_file_size=None, max_file_records=None):
+        self.batch_size = batch_size
+        self.checkpoints = checkpoints
+        self.writers = writers
+        self.queue_size = queue_size or self.QUEUE_SIZE
+        self.output_dir = output_dir or self.OUTPUT_DIR
+        self.partitioner = partitioner or Partitioner()
+        self.max_file_size = max_file_size
+        self.max_file_records = max_file_records
         self.log = logging.getLogger(f'pipeline.loaders.{self.__class__.__name__}')
+        self.encoder = Encoder.get_instance(encoder, date_format=self.DATE_FORMAT)
+        if self.encoder is None:
+            self.log.warning(f"encoder '{encoder}' is not installed, using json")
+            self.encoder = Encoder(self.DATE_FORMAT)
+        self._counter = defaultdict(lambda: 1)
+        self.bytes_written = 0
+        self._queues = []
+        self._threads = []
+        self._next_queue = 0
+        self._lock = threading.Lock()
+        self._dir_fds = {}
+
+        # source names whose writes failed, source name -> input file path
+        self._failed = set()
+        self._source_files = {}
+
+        # source name -> partition -> output file, open ones least recently written first
+        self._outputs = defaultdict(dict)
+        self._open_outputs = defaultdict(OrderedDict)
+
+    @classmethod
+    def get_class(cls, output_format):
+        return cls._registry.get(output_format)
+
+    @classmethod
+    def get_instance(cls, output_format, **kwargs):
+        loader_class = cls.get_class(output_format)
+        return loader_class(**kwargs) if loader_class else None
 
     def dump(self, payload):
+        self.partitioner.start()
+        partition = self.partitioner.partition
+        counter = self._counter
+        dumped = 0
+        self._start()
+        try:
+            for record in payload:
+                source_name = record.source.name
+                try:
+                    data = record.data
+                    if record.resumed:
+                        self._resume(source_name, record.resumed[-1])
+                    if data is not None:
+                        self._source_files[source_name] = record.source.file_path
+                        index = counter[source_name]
+                        counter[source_name] += 1
+                        self._write(partition(record), source_name, index, data)
+                        dumped += 1
+                    if record.checkpoint:
+                        self._sync(source_name)
+                        self._join()
+                        if self._has_failed(record.checkpoint[0]):
+                            record.checkpoint = None
+                        else:
+                            self._commit(source_name, record.checkpoint)
+                    if record.completed:
+                        self._flush()
+                        self._join()
+                        if self._has_failed(record.completed[0]):
+                            self.log.error(f'not completed after failed writes path={record.completed[0]}')
+                            record.completed = None
+                        else:
+                            self._complete(*record.completed)
+                except Exception as error:
+                    self.log.exception(error)
+                    self._fail(source_name, record.source.file_path)
+        finally:
+            self._flush()
+            self._stop()
+            self._close_dirs()
+        return dumped
 
-        # build path
-        today = date.today()
-        dir_path = Path(f'output/{today.year}/{today.month}/{today.day}')
-        dir_path.mkdir(parents=True, exist_ok=True)
+    def _start(self):
+        self._queues = [Queue(self.queue_size) for _ in range(self.writers)]
+        self._next_queue = 0
+        self._threads = [
+            threading.Thread(target=self._run_writer, args=(queue,), name=f'writer-{i}', daemon=True)
+            for i, queue in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
 
-        # dump payload
-        counter = defaultdict(lambda: 1)
-        for item in payload:
+    def _run_writer(self, queue):
+        written = 0
+        while True:
+            job = queue.get()
             try:
-                data = self._sanitise_item(item['data'])
-                source_name = f'{os.path.splitext(item["file"])[0]}-{item["file_type"]}'
-                filename = f'{source_name}-{counter[source_name]}.json'
-                counter[source_name] += 1
-                with open(os.path.join(dir_path, filename), 'w') as f:
-                    json.dump(data, f)
+                if job is None:
+                    break
+                source_name, function, args = job
+                written += function(*args) or 0
             except Exception as error:
                 self.log.exception(error)
+                self._fail(source_name)
+            finally:
+                queue.task_done()
+        with self._lock:
+            self.bytes_written += written
+
+    def _submit(self, source_name, function, *args):
+        """Run a write job of source_name returning the bytes it wrote, on a writer thread if there are writers."""
+        if self._queues:
+            if self.APPEND_WRITES:
+                queue = self._queues[hash(source_name) % len(self._queues)]
+            else:
+                queue = self._queues[self._next_queue]
+                self._next_queue = (self._next_queue + 1) % len(self._queues)
+            queue.put((source_name, function, args))
+        else:
+            try:
+                self.bytes_written += function(*args) or 0
+            except Exception as error:
+                self.log.exception(error)
+                self._fail(source_name)
+
+    def _fail(self, source_name, file_path=None):
+        with self._lock:
+            self._failed.add(source_name)
+            if file_path is not None:
+                self._source_files.setdefault(source_name, file_path)
+
+    def _has_failed(self, file_path):
+        """Return whether a write of a source extracted from file_path failed."""
+        with self._lock:
+            return any(self._source_files.get(source_name) == file_path for source_name in self._failed)
+
+    def _join(self):
+        for queue in self._queues:
+            queue.join()
+
+    def _stop(self):
+        for queue in self._queues:
+            queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._queues = []
+        self._threads = []
+
+    def _dir_fd(self, partition):
+        fd = self._dir_fds.get(partition)
+        if fd is None:
+            with self._lock:
+                fd = self._dir_fds.get(partition)
+                if fd is None:
+                    dir_path = os.path.join(self.output_dir, partition)
+                    os.makedirs(dir_path, exist_ok=True)
+                    fd = self._dir_fds[partition] = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+        return fd
+
+    def _close_dirs(self):
+        for fd in self._dir_fds.values():
+            os.close(fd)
+        self._dir_fds.clear()
+
+    def _open(self, partition, file_name, append=False):
+        """Open file_name in partition for binary writing, relative to the open partition directory."""
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+        fd = os.open(file_name, flags, 0o666, dir_fd=self._dir_fd(partition))
+        return open(fd, 'ab' if append else 'wb')
+
+    def _file_path(self, partition, file_name):
+        return os.path.join(self.output_dir, partition, file_name)
+
+    def _write(self, partition, source_name, index, data):
+        self._submit(source_name, self._write_file, partition, f'{source_name}-{index}{self.FILE_EXTENSION}', data)
+
+    def _write_file(self, partition, file_name, data):
+        with self._open(partition, file_name) as f:
+            return f.write(self.encoder.encode(data))
+
+    def _flush(self):
+        pass
+
+    def _sync(self, source_name):
+        pass
+
+    def _state(self, source_name):
+        return self._counter[source_name]
+
+    def _resume(self, source_name, state):
+        self._counter[source_name] = state
+
+    @staticmethod
+    def _truncate(file_path, size):
+
+        # drop output written after the checkpoint, it is extracted and written again
+        if size is not None and os.path.exists(file_path) and os.path.getsize(file_path) > size:
+            os.truncate(file_path, size)
+
+    def _complete(self, file_path, keep_checkpoint):
+        if self.checkpoints is not None:
+            self.checkpoints.add(file_path, keep_checkpoint)
+
+    def _commit(self, source_name, checkpoint):
+        if self.checkpoints is not None:
+            file_path, offset, row = checkpoint
+            self.checkpoints.set_checkpoint(file_path, offset, row, self._state(source_name))
+
+    # output files appended to, used by loaders writing a file per source and partition
+
+    def _output_name(self, source_name, roll):
+        return f'{source_name}{self.FILE_EXTENSION}' if roll == 1 else f'{source_name}-{roll}{self.FILE_EXTENSION}'
+
+    def _append(self, partition, source_name, data, records=1):
+        """Append data holding records to the output file of source_name in partition, rolled over if full."""
+        output = self._outputs[source_name].get(partition)
+        if output is None:
+            output = self._outputs[source_name][partition] = OutputFile(partition, source_name)
+        if output.size > len(self.FILE_HEADER) and (
+                self.max_file_size and output.size + len(data) > self.max_file_size
+                or self.max_file_records and output.records + records > self.max_file_records):
+            self._close_output(output)
+            output.roll += 1
+            output.size = output.records = 0
+        open_outputs = self._open_outputs[source_name]
+        if output.file is None:
+            if len(open_outputs) >= self.MAX_OPEN_FILES:
+                self._close_output(next(iter(open_outputs.values())))
+            output.file = WriteBuffer(
+                self._open(partition, self._output_name(source_name, output.roll), append=output.size > 0),
+                self.BUFFER_SIZE)
+            open_outputs[partition] = output
+            if not output.size and self.FILE_HEADER:
+                output.size += output.file.write(self.FILE_HEADER)
+        else:
+            open_outputs.move_to_end(partition)
+        written = output.file.write(data)
+        output.size += written
+        output.records += records
+        return written
+
+    def _flush_outputs(self, source_name):
+        for output in self._open_outputs[source_name].values():
+            output.file.flush()
+
+    def _close_outputs(self, source_name):
+        for output in list(self._open_outputs[source_name].values()):
+            self._close_output(output)
+
+    def _close_output(self, output):
+        self._open_outputs[output.source_name].pop(output.partition, None)
+        if output.file is not None:
+            output.file.close()
+            output.file = None
+
+    def _outputs_state(self, source_name):
+        """Loader state of appended output: partition -> [roll, size, records] of the current file."""
+        return {partition: output.state() for partition, output in self._outputs[source_name].items()}
+
+    def _resume_outputs(self, source_name, state):
+        if not isinstance(state, dict):
+            self.log.warning(f'ignored loader state source={source_name} state={state}')
+            return
+        for partition, (roll, size, records) in state.items():
+            self._truncate(self._file_path(partition, self._output_name(source_name, roll)), size)
+            self._outputs[source_name][partition] = OutputFile(partition, source_name, roll, size, records)
+
+
+Loader._registry[Loader.OUTPUT_FORMAT] = Loader
+
+
+class NdjsonLoader(Loader):
+    """
+    Dump records as newline-delimited JSON, a file per source and partition.
+
+    Files are rolled over to {source}-{n}.ndjson by max_file_size bytes and max_file_records records. The files of a
+    source are open while its records come in, lines are collected in a WriteBuffer; files are only touched by the
+    writer of their source.
+    """
+    OUTPUT_FORMAT = 'ndjson'
+    FILE_EXTENSION = '.ndjson'
+    APPEND_WRITES = True
+
+    def __init__(self, batch_size=None, checkpoints=None, **kwargs):
+        super(NdjsonLoader, self).__init__(batch_size, checkpoints, **kwargs)
+        self._source_name = None
+
+    def _write(self, partition, source_name, index, data):
+        if source_name != self._source_name:
+            if self._source_name is not None:
+                self._submit(self._source_name, self._close_outputs, self._source_name)
+            self._source_name = source_name
+        self._submit(source_name, self._write_line, partition, source_name, data)
+
+    def _write_line(self, partition, source_name, data):
+        return self._append(partition, source_name, self.encoder.encode_line(data))
+
+    def _flush(self):
+        if self._source_name is not None:
+            self._submit(self._source_name, self._close_outputs, self._source_name)
+        self._source_name = None
+
+    def _sync(self, source_name):
+        self._submit(source_name, self._flush_outputs, source_name)
+
+    def _state(self, source_name):
+        return self._outputs_state(source_name)
+
+    def _resume(self, source_name, state):
+        self._resume_outputs(source_name, state)
+
+
+class BatchLoader(Loader):
+    """
+    Base class for loaders collecting batch_size records per source and partition before writing them at once.
+
+    Batches are also cut at checkpoints.
+    """
+    OUTPUT_FORMAT = None
+    BATCH_SIZE = 10000
+
+    def __init__(self, batch_size=None, checkpoints=None, **kwargs):
+        super(BatchLoader, self).__init__(batch_size or self.BATCH_SIZE, checkpoints, **kwargs)
+        self._batches = defaultdict(list)
+        self._batch_counter = defaultdict(lambda: 1)
+
+    def _write(self, partition, source_name, index, data):
+        key = (partition, source_name)
+        batch = self._batches[key]
+        batch.append(data)
+        if len(batch) >= self.batch_size:
+            self._write_batch(key)
+
+    def _flush(self):
+        for key in list(self._batches):
+            self._write_batch(key)
+
+    def _sync(self, source_name):
+        for key in [key for key in self._batches if key[1] == source_name]:
+            self._write_batch(key)
+
+    def _state(self, source_name):
+        return self._batch_counter[source_name]
+
+    def _resume(self, source_name, state):
+        self._batch_counter[source_name] = state
+
+    def _write_batch(self, key):
+        batch = self._batches.pop(key, None)
+        if batch:
+            partition, source_name = key
+            index = self._batch_counter[source_name]
+            self._batch_counter[source_name] += 1
+            self._submit(source_name, self._dump_batch, partition, source_name, index, batch)
+
+    def _dump_batch(self, partition, source_name, index, batch):
+        """Write a batch, return the bytes written."""
+        raise NotImplementedError
+
+
+class JsonArrayLoader(BatchLoader):
+    """Dump records as JSON arrays of batch_size records per file."""
+    OUTPUT_FORMAT = 'json-array'
+
+    def _dump_batch(self, partition, source_name, index, batch):
+        return self._write_file(partition, f'{source_name}-{index}{self.FILE_EXTENSION}', batch)
+
+
+class ColumnarLoader(BatchLoader):
+    """
+    Dump records in a compact columnar binary layout, a file per source and partition.
+
+    Files are rolled over to {source}-{n}.col by max_file_size bytes and max_file_records records, at row group
+    boundaries.
+
+    File layout: MAGIC, then one row group per batch:
+      row count (uint32), column count (uint16), then per column:
+        name length (uint16), name (utf-8), data length (uint32), data
+    Column data holds each value as length (uint32) and utf-8 text, NULL_LENGTH for null.
+    """
+    OUTPUT_FORMAT = 'columnar'
+    FILE_EXTENSION = '.col'
+    MAGIC = b'PYCOL1\n'
+    FILE_HEADER = MAGIC
+    NULL_LENGTH = 0xFFFFFFFF
+    APPEND_WRITES = True
+
+    def _flush(self):
+        super(ColumnarLoader, self)._flush()
+        for source_name in list(self._batch_counter):
+            self._submit(source_name, self._close_outputs, source_name)
+
+    def _sync(self, source_name):
+        super(ColumnarLoader, self)._sync(source_name)
+        self._submit(source_name, self._flush_outputs, source_name)
+
+    def _state(self, source_name):
+        return self._outputs_state(source_name)
+
+    def _resume(self, source_name, state):
+        self._resume_outputs(source_name, state)
+
+    def _dump_batch(self, partition, source_name, index, batch):
+        columns = {}
+        for record in batch:
+            for key in record:
+                columns.setdefault(key, None)
+        parts = [struct.pack('<IH', len(batch), len(columns))]
+        for column in columns:
+            name = column.encode()
+            data = b''.join(self._encode_value(record.get(column)) for record in batch)
+            parts.append(struct.pack('<H', len(name)))
+            parts.append(name)
+            parts.append(struct.pack('<I', len(data)))
+            parts.append(data)
+        return self._append(partition, source_name, b''.join(parts), len(batch))
+
+    def _encode_value(self, value):
+        if value is None:
+            return struct.pack('<I', self.NULL_LENGTH)
+        if isinstance(value, date):
+            value = self.encoder.format_date(value)
+        encoded = str(value).encode()
+        return struct.pack('<I', len(encoded)) + encoded
+
+
+def read_columnar(file_path):
+    """Yield records from a file written by ColumnarLoader."""
+    with open(file_path, 'rb') as f:
+        buffer = f.read()
+    if not buffer.startswith(ColumnarLoader.MAGIC):
+        raise ValueError(f"'{file_path}' is not a columnar file")
+    offset = len(ColumnarLoader.MAGIC)
+    while offset < len(buffer):
+        rows, column_count = struct.unpack_from('<IH', buffer, offset)
+        offset += struct.calcsize('<IH')
+        columns = {}
+        for _ in range(column_count):
+            name_length, = struct.unpack_from('<H', buffer, offset)
+            offset += 2
+            name = buffer[offset:offset + name_length].decode()
+            offset += name_length
+            data_length, = struct.unpack_from('<I', buffer, offset)
+            offset += 4
+            columns[name] = _decode_column(buffer[offset:offset + data_length], rows)
+            offset += data_length
+        for row in range(rows):
+            yield {name: values[row] for name, values in columns.items()}
+
 
-    def _sanitise_item(self, item):
-        processed = {}
-        for key, value in item.items():
-            if isinstance(value, (date, datetime)):
-                value = value.strftime(self.DATE_FORMAT)
-            processed[key] = value
-        return processed
+def _decode_column(data, rows):
+    values = []
+    offset = 0
+    for _ in range(rows):
+        length, = struct.unpack_from('<I', data, offset)
+        offset += 4
+        if length == ColumnarLoader.NULL_LENGTH:
+            values.append(None)
+        else:
+            values.append(data[offset:offset + length].decode())
+            offset += length
+    return values
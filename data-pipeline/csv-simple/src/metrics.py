@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+
+class Metrics(object):
+    """
+    Counters and stage timings of the pipeline, cumulative over the life of the process.
+
+    Stages are iterables chained into each other (extract -> process -> dedup -> load), so the time spent pulling a
+    row out of a stage includes the time of the stages upstream; the upstream share is subtracted to get the time of
+    the stage itself. With worker processes extraction is timed as part of process.
+
+    Counters are reported as a structured log line every period seconds and at the end of each run, and written in
+    Prometheus text format to prometheus_file when it is set.
+    """
+    STAGES = ('extract', 'process', 'dedup', 'load')
+    PREFIX = 'pipeline'
+    CHECK_ROWS = 1000
+
+    def __init__(self, period=60, prometheus_file=None):
+        self.period = period
+        self.prometheus_file = prometheus_file
+        self.log = logging.getLogger(f'pipeline.metrics.{self.__class__.__name__}')
+        self.started = time.monotonic()
+        self.rows = Counter()
+        self.rejected = Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.files = 0
+        self.duplicates = 0
+        self._seconds = Counter()
+        self._run_seconds = Counter()
+        self._last_report = self.started
+
+    def timed(self, stage, iterable):
+        """Yield records from iterable, timing each step as stage and counting the rows with data out of it."""
+        run_seconds = self._run_seconds
+        rows = self.rows
+        iterator = iter(iterable)
+        clock = time.perf_counter
+        counted = 0
+        while True:
+            started = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                run_seconds[stage] += clock() - started
+                break
+            run_seconds[stage] += clock() - started
+            if item.data is not None:
+                counted += 1
+
+            # the clock is only looked at every CHECK_ROWS rows
+            if counted == self.CHECK_ROWS:
+                rows[stage] += counted
+                counted = 0
+                self.report_if_due()
+            yield item
+        rows[stage] += counted
+
+    def add_time(self, stage, seconds):
+        self._run_seconds[stage] += seconds
+
+    def end_run(self):
+        """Fold the stage timings of the finished run into the totals, then report."""
+        self._seconds.update(self._stage_seconds(self._run_seconds))
+        self._run_seconds.clear()
+        self.report()
+
+    def _stage_seconds(self, inclusive):
+        seconds = {}
+        upstream = 0.0
+        for stage in self.STAGES:
+            if stage in inclusive:
+                seconds[stage] = max(inclusive[stage] - upstream, 0.0)
+                upstream = inclusive[stage]
+        return seconds
+
+    def snapshot(self):
+        seconds = Counter(self._seconds)
+        seconds.update(self._stage_seconds(self._run_seconds))
+        uptime = time.monotonic() - self.started
+        stages = {}
+        rows_in = None
+        for stage in self.STAGES:
+            if stage not in self.rows and stage not in seconds:
+                continue
+            rows_out = self.rows[stage]
+            stages[stage] = dict(
+                seconds=round(seconds[stage], 6),
+                rows_in=rows_out if rows_in is None else rows_in,
+                rows_out=rows_out)
+            rows_in = rows_out
+        return dict(
+            uptime=round(uptime, 3),
+            stages=stages,
+            rejected={f'{field}:{reason}': count for (field, reason), count in sorted(self.rejected.items())},
+            bytes_read=self.bytes_read,
+            bytes_written=self.bytes_written,
+            files=self.files,
+            duplicates=self.duplicates,
+            files_per_second=round(self.files / uptime, 3) if uptime else 0.0)
+
+    def report_if_due(self):
+        if time.monotonic() - self._last_report >= self.period:
+            self.report()
+
+    def report(self):
+        snapshot = self.snapshot()
+        self.log.info(f'metrics {json.dumps(snapshot, separators=(",", ":"))}')
+        if self.prometheus_file:
+            self.write_prometheus(snapshot)
+        self._last_report = time.monotonic()
+
+    def write_prometheus(self, snapshot):
+        prefix = self.PREFIX
+        lines = [
+            f'# TYPE {prefix}_stage_seconds_total counter',
+            *(f'{prefix}_stage_seconds_total{{stage="{stage}"}} {values["seconds"]}'
+              for stage, values in snapshot['stages'].items()),
+            f'# TYPE {prefix}_rows_in_total counter',
+            *(f'{prefix}_rows_in_total{{stage="{stage}"}} {values["rows_in"]}'
+              for stage, values in snapshot['stages'].items()),
+            f'# TYPE {prefix}_rows_out_total counter',
+            *(f'{prefix}_rows_out_total{{stage="{stage}"}} {values["rows_out"]}'
+              for stage, values in snapshot['stages'].items()),
+            f'# TYPE {prefix}_rejected_cells_total counter',
+            *(f'{prefix}_rejected_cells_total{{field="{field}",reason="{reason}"}} {count}'
+              for (field, reason), count in sorted(self.rejected.items())),
+            f'# TYPE {prefix}_bytes_read_total counter',
+            f'{prefix}_bytes_read_total {snapshot["bytes_read"]}',
+            f'# TYPE {prefix}_bytes_written_total counter',
+            f'{prefix}_bytes_written_total {snapshot["bytes_written"]}',
+            f'# TYPE {prefix}_files_total counter',
+            f'{prefix}_files_total {snapshot["files"]}',
+            f'# TYPE {prefix}_duplicates_total counter',
+            f'{prefix}_duplicates_total {snapshot["duplicates"]}',
+            f'# TYPE {prefix}_files_per_second gauge',
+            f'{prefix}_files_per_second {snapshot["files_per_second"]}',
+            f'# TYPE {prefix}_uptime_seconds gauge',
+            f'{prefix}_uptime_seconds {snapshot["uptime"]}',
+        ]
+
+        # written aside and renamed, so a scraper never reads a partial file
+        os.makedirs(os.path.dirname(os.path.abspath(self.prometheus_file)), exist_ok=True)
+        temp_path = f'{self.prometheus_file}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.prometheus_file)
@@ -0,0 +1,104 @@
+import re
+import zlib
+from datetime import date
+
+
+class Partitioner(object):
+    """
+    Map records to output partitions, directories relative to the output directory.
+
+    The base partitioner partitions by processing date ({year}/{month}/{day}), taken when a dump starts. Subclasses
+    partition by a record field, the source or a hash shard of fields, in field=value directories.
+    """
+    PARTITION_BY = 'date'
+    NULL = '_null'
+    CACHE_SIZE = 4096
+    UNSAFE = re.compile(r'[^\w.@-]+')
+
+    # partition_by -> partitioner class
+    _registry = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Partitioner._registry[cls.PARTITION_BY] = cls
+
+    def __init__(self, fields=None, shards=None):
+        self.fields = tuple(fields or ())
+        self.shards = shards
+        self._partition = None
+        self._cache = {}
+
+    @classmethod
+    def get_class(cls, partition_by):
+        return cls._registry.get(partition_by)
+
+    @classmethod
+    def get_instance(cls, partition_by, **kwargs):
+        partitioner_class = cls.get_class(partition_by)
+        return partitioner_class(**kwargs) if partitioner_class else None
+
+    def start(self):
+        """Called when a dump starts."""
+        today = date.today()
+        self._partition = f'{today.year}/{today.month}/{today.day}'
+
+    def partition(self, record):
+        return self._partition
+
+    def _format(self, name, value):
+        if value is None:
+            return f'{name}={self.NULL}'
+        if isinstance(value, date):
+            return f'{name}={value.isoformat()}'
+        return f'{name}={self.UNSAFE.sub("_", str(value).strip()) or self.NULL}'
+
+    def _cached(self, name, value):
+        partition = self._cache.get(value)
+        if partition is None:
+            partition = self._format(name, value)
+            if len(self._cache) < self.CACHE_SIZE:
+                self._cache[value] = partition
+        return partition
+
+
+Partitioner._registry[Partitioner.PARTITION_BY] = Partitioner
+
+
+class FieldPartitioner(Partitioner):
+    """Partition by the value of a record field, e.g. created_at=2020-05-23."""
+    PARTITION_BY = 'field'
+
+    def __init__(self, fields=None, shards=None):
+        super(FieldPartitioner, self).__init__(fields, shards)
+        if len(self.fields) != 1:
+            raise ValueError('field partitioning takes exactly one field')
+        self._field = self.fields[0]
+
+    def partition(self, record):
+        return self._cached(self._field, record.data.get(self._field))
+
+
+class SourcePartitioner(Partitioner):
+    """Partition by source, e.g. source=users-csv."""
+    PARTITION_BY = 'source'
+
+    def partition(self, record):
+        return self._cached('source', record.source.name)
+
+
+class ShardPartitioner(Partitioner):
+    """Partition into shards by a stable hash of the normalized values of fields, e.g. shard=07."""
+    PARTITION_BY = 'shard'
+
+    def __init__(self, fields=None, shards=None):
+        super(ShardPartitioner, self).__init__(fields, shards)
+        if not self.fields or not shards:
+            raise ValueError('shard partitioning takes fields and a number of shards')
+        width = len(str(shards - 1))
+        self._names = [f'shard={shard:0{width}d}' for shard in range(shards)]
+
+    def partition(self, record):
+        data = record.data
+        key = '\x1f'.join('' if data.get(field) is None else str(data.get(field)).strip().lower()
+                          for field in self.fields)
+        return self._names[zlib.crc32(key.encode()) % self.shards]
@@ -1,9 +1,25 @@
 import logging
 import re
-from datetime import datetime
+from collections import Counter
+
+from src.dates import DateParser
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class RejectedValue(ValueError):
+    """Raised by field handlers for values failing validation, reason is a short stable label for counting."""
+
+    def __init__(self, reason, message):
+        super(RejectedValue, self).__init__(message)
+        self.reason = reason
 
 
 class Processor(object):
+    """Base class of processors, subclasses register under FILE_TYPE when they are defined."""
     FILE_TYPE = None
 
     # TODO rename these in some smarter way
@@ -16,51 +32,189 @@ class Processor(object):
     )
     NULL_VALUES = None
 
-    def __init__(self):
+    # header entry: (output name, field handler name, nullable, strict)
+    SCHEMA = None
+
+    # file type -> processor class, file type -> instance shared within the process
+    _registry = {}
+    _instances = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.FILE_TYPE:
+            Processor._registry[cls.FILE_TYPE] = cls
+
+    def __init__(self, rejected=None):
         self.log = logging.getLogger(f'pipeline.processors.{self.__class__.__name__}')
 
+        # (output name, reason) -> rejected cells
+        self.rejected = Counter() if rejected is None else rejected
+        self._date_parsers = {}
+        self._header = None
+        self._plan = None
+
+        # header values -> plan
+        self._plans = {}
+
     @classmethod
-    def get_instance(cls, file_type):
-        if cls.FILE_TYPE == file_type:
-            return cls()
-        for sub in cls.__subclasses__():
-            return sub.get_instance(file_type)
+    def get_class(cls, file_type):
+        return cls._registry.get(file_type)
 
-    def process(self, item):
-        return self._process_item(item)
+    @classmethod
+    def get_instance(cls, file_type, **kwargs):
+        processor_class = cls.get_class(file_type)
+        return processor_class(**kwargs) if processor_class else None
+
+    @classmethod
+    def get_shared_instance(cls, file_type, rejected=None):
+        """
+        Return the instance of file_type shared within the process, so header plans and date parser caches carry over
+        between files and runs.
+
+        :param rejected: counter the instance counts rejected cells into from now on, if given
+        """
+        processor = cls._instances.get(file_type)
+        if processor is None:
+            processor = cls.get_instance(file_type)
+            if processor is None:
+                return None
+            cls._instances[file_type] = processor
+        if rejected is not None:
+            processor.rejected = rejected
+        return processor
 
-    def _process_item(self, item):
-        raise NotImplementedError()
+    def process(self, item, header):
+        return self._process_item(item, self._get_plan(header))
 
-    def _process_text_field(self, value, nullable=True, strict=False):
+    def compile_plan(self, header):
+        """Resolve header against SCHEMA into a tuple of (index, output name, field handler, nullable, strict)."""
+        plan = []
+        for index, key in enumerate(header):
+            key = key.strip()
+            if key not in self.SCHEMA:
+                self.log.error(f"'{key}' is an unknown entry")
+                continue
+            name, handler, nullable, strict = self.SCHEMA[key]
+            plan.append((index, name, getattr(self, handler), nullable, strict))
+        missing = set(self.SCHEMA) - {key.strip() for key in header}
+        if missing:
+            self.log.warning(f'missing entries {sorted(missing)}')
+        return tuple(plan)
+
+    def _get_plan(self, header):
+
+        # rows of a file share the header object; byte ranges of a file extracted apart have equal headers, so the
+        # plan is compiled once per header
+        if header is not self._header:
+            key = tuple(header)
+            plan = self._plans.get(key)
+            if plan is None:
+                plan = self._plans[key] = self.compile_plan(header)
+            self._header, self._plan = header, plan
+        return self._plan
+
+    def _process_item(self, item, plan):
+        processed = {}
+        for index, name, handler, nullable, strict in plan:
+            try:
+                processed[name] = handler(item[index].strip(), nullable, strict, name)
+
+            # rejected cells are only counted, a traceback per cell is too costly on dirty data
+            except RejectedValue as error:
+                self.rejected[name, error.reason] += 1
+            except IndexError:
+                self.rejected[name, 'missing'] += 1
+            except Exception as error:
+                self.rejected[name, 'error'] += 1
+                self.log.exception(error)
+        return processed
+
+    def process_batch(self, columns):
+        """
+        Process whole columns at once.
+
+        Each column is factorized into its distinct stripped values, the field handler runs once per distinct value
+        and the results are broadcast back to the rows (with numpy arrays when numpy is installed).
+
+        :param columns: dict of header entry to sequence of raw values, all of the same length
+        :return: tuple of (valid, converted) dicts of output name to validity mask and converted values
+        """
+        valid = {}
+        converted = {}
+        for key, values in columns.items():
+            key = key.strip()
+            if key not in self.SCHEMA:
+                self.log.error(f"'{key}' is an unknown entry")
+                continue
+            name, handler, nullable, strict = self.SCHEMA[key]
+            handler = getattr(self, handler)
+            uniques, inverse = self._factorize(values)
+            masks = []
+            results = []
+            reasons = {}
+            for i, value in enumerate(uniques):
+                try:
+                    results.append(handler(value, nullable, strict, name))
+                    masks.append(True)
+                except ValueError as error:
+                    results.append(None)
+                    masks.append(False)
+                    reasons[i] = getattr(error, 'reason', 'error')
+            valid[name], converted[name] = self._broadcast(masks, results, inverse)
+            if reasons:
+                self.log.error(f"'{key}' has {len(reasons)} distinct invalid values")
+                counts = Counter(inverse.tolist() if numpy is not None else inverse)
+                for i, reason in reasons.items():
+                    self.rejected[name, reason] += counts[i]
+        return valid, converted
+
+    @staticmethod
+    def _factorize(values):
+
+        # hash based, faster than sorting with numpy.unique
+        index = {}
+        inverse = [index.setdefault(value.strip(), len(index)) for value in values]
+        if numpy is not None:
+            inverse = numpy.array(inverse, dtype=numpy.intp)
+        return list(index), inverse
+
+    @staticmethod
+    def _broadcast(masks, results, inverse):
+        if numpy is not None:
+            converted = numpy.empty(len(results), dtype=object)
+            converted[:] = results
+            return numpy.array(masks, dtype=bool)[inverse], converted[inverse]
+        return [masks[i] for i in inverse], [results[i] for i in inverse]
+
+    def _process_text_field(self, value, nullable=True, strict=False, column=None):
         if not value or value.lower() in self.NULL_VALUES:
             if nullable and not strict:
                 return None
-            raise ValueError(f"'{value}' is null")
+            raise RejectedValue('null', f"'{value}' is null")
         return value
 
-    def _process_email_field(self, value, nullable=True, strict=False):
+    def _process_email_field(self, value, nullable=True, strict=False, column=None):
         if not value or not self.MATCH_EMAIL.fullmatch(value):
             if nullable and not strict:
                 return None
-            raise ValueError(f"'{value}' is not a valid email address")
+            raise RejectedValue('invalid_email', f"'{value}' is not a valid email address")
         return value
 
-    def _process_date_field(self, value, nullable=True, strict=False):
+    def _get_date_parser(self, column):
+        parser = self._date_parsers.get(column)
+        if parser is None:
+            parser = self._date_parsers[column] = DateParser(self.DATETIME_TEMPLATES)
+        return parser
+
+    def _process_date_field(self, value, nullable=True, strict=False, column=None):
         if value:
-            date_value = None
-            for dt_format in self.DATETIME_TEMPLATES:
-                try:
-                    date_value = datetime.strptime(value, dt_format).date()
-                    break
-                except ValueError:
-                    continue
+            date_value = self._get_date_parser(column).parse(value)
             if date_value or not strict:
                 return date_value
             return date_value
         elif nullable and not strict:
             return None
-        raise ValueError(f"'{value}' is not a valid date")
+        raise RejectedValue('null', f"'{value}' is not a valid date")
 
 
 class CsvProcessor(Processor):
@@ -78,22 +232,9 @@ class CsvProcessor(Processor):
         '-'
     )
 
-    def _process_item(self, item):
-        processed = {}
-        for key, value in item.items():
-            try:
-                key = key.strip()
-                value = value.strip()
-                if key == 'Name':
-                    processed['name'] = self._process_text_field(value, nullable=False, strict=True)
-                elif key == 'Email':
-                    processed['email'] = self._process_email_field(value, nullable=False, strict=True)
-                elif key == 'Comment':
-                    processed['comment'] = self._process_text_field(value, nullable=True)
-                elif key == 'Created At':
-                    processed['created_at'] = self._process_date_field(value, nullable=True)
-                else:
-                    raise ValueError(f"'{key}' is an unknown entry")
-            except Exception as error:
-                self.log.exception(error)
-        return processed
+    SCHEMA = {
+        'Name': ('name', '_process_text_field', False, True),
+        'Email': ('email', '_process_email_field', False, True),
+        'Comment': ('comment', '_process_text_field', True, False),
+        'Created At': ('created_at', '_process_date_field', True, False),
+    }
@@ -0,0 +1,41 @@
+import os
+
+
+class Source(object):
+    """
+    Metadata of an input file, shared by all of its records.
+
+    file is the name the records come from, the file name of file_path unless the input is inside it.
+    """
+    __slots__ = ('file_path', 'file', 'file_type', 'header', 'name')
+
+    def __init__(self, file_path, file_type, header=None, file=None):
+        self.file_path = file_path
+        self.file = file or os.path.split(file_path)[1]
+        self.file_type = file_type
+        self.header = header
+        self.name = f'{os.path.splitext(self.file)[0]}-{file_type}'
+
+    def __repr__(self):
+        return f'Source(file_path={self.file_path!r}, file_type={self.file_type!r})'
+
+
+class Record(object):
+    """
+    Row travelling through the pipeline.
+
+    data holds the extracted row, replaced by the processed dict; checkpoint and resumed are set on the rows the
+    extractor checkpoints or resumes at. Records without data only carry markers, completed (file path, keep
+    checkpoint) follows the last record of a completely extracted file.
+    """
+    __slots__ = ('source', 'data', 'checkpoint', 'resumed', 'completed')
+
+    def __init__(self, source, data, checkpoint=None, resumed=None, completed=None):
+        self.source = source
+        self.data = data
+        self.checkpoint = checkpoint
+        self.resumed = resumed
+        self.completed = completed
+
+    def __repr__(self):
+        return f'Record(source={self.source!r}, data={self.data!r})'
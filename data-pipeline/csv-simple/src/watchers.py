@@ -0,0 +1,148 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+from src import extractors
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class Watcher(object):
+    """Yield lists of new input files by scanning the input directory every period seconds."""
+    period = None
+    debounce = None
+    input_dir = None
+    log = None
+
+    def __init__(self, input_dir, period, debounce):
+        self.input_dir = input_dir
+        self.period = period
+        self.debounce = debounce
+        self.log = logging.getLogger(f'pipeline.watchers.{self.__class__.__name__}')
+
+    @classmethod
+    def get_instance(cls, input_dir, period, debounce, poll=False):
+        if not poll and InotifyWatcher.is_available():
+            return InotifyWatcher(input_dir, period, debounce)
+        return cls(input_dir, period, debounce)
+
+    def watch(self):
+        while True:
+            yield extractors.scan_input_dir(self.input_dir)
+            time.sleep(self.period)
+
+
+class InotifyWatcher(Watcher):
+    """
+    Yield input files as soon as their writers close them, using Linux inotify.
+
+    A file is ready debounce seconds after its last close or move into the directory, so files still being written
+    are left alone; files modified but never closed are ready after period seconds without events. The input
+    directory is only scanned on start, for files which arrived while not watching, and after event queue overflows,
+    when events were lost.
+    """
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    _libc = None
+
+    @classmethod
+    def is_available(cls):
+        if cls._libc is None:
+            cls._libc = _load_libc() or False
+        return bool(cls._libc)
+
+    def watch(self):
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        try:
+            if self._libc.inotify_add_watch(fd, os.fsencode(self.input_dir), self.MASK) < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {self.input_dir}')
+            self.log.info(f'watching input_dir={self.input_dir}')
+
+            # pending file name: ready at
+            pending = {}
+            rescan = True
+            while True:
+                if rescan:
+                    rescan = False
+                    file_paths = [
+                        file_path
+                        for file_path
+                        in extractors.scan_input_dir(self.input_dir)
+                        if os.path.basename(file_path) not in pending
+                    ]
+                    if file_paths:
+                        yield file_paths
+                        continue
+                now = time.monotonic()
+                ready = [name for name, ready_at in pending.items() if ready_at <= now]
+                if ready:
+                    for name in ready:
+                        del pending[name]
+                    extractors.compact_file_cache_if_due()
+                    file_paths = [os.path.join(self.input_dir, name) for name in ready if self._is_valid(name)]
+                    if file_paths:
+                        yield file_paths
+                    continue
+
+                # without pending files, wait for events only
+                timeout = max(0, min(pending.values()) - now) if pending else None
+                readable, _, _ = select.select([fd], [], [], timeout)
+                if readable and self._read_events(fd, pending):
+                    self.log.warning(f'event queue overflowed, rescanning input_dir={self.input_dir}')
+                    rescan = True
+        finally:
+            os.close(fd)
+
+    def _is_valid(self, name):
+        try:
+            return extractors._is_file_valid(self.input_dir, name)
+        except OSError:
+            return False
+
+    def _read_events(self, fd, pending):
+        """Update pending files from queued events, return True if the event queue overflowed."""
+        try:
+            buffer = os.read(fd, READ_SIZE)
+        except BlockingIOError:
+            return False
+        overflowed = False
+        now = time.monotonic()
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+            elif not name or mask & IN_ISDIR:
+                continue
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                pending.pop(name, None)
+            else:
+                pending[name] = now + (self.debounce if mask & (IN_CLOSE_WRITE | IN_MOVED_TO) else self.period)
+        return overflowed
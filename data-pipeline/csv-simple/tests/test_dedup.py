@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+
+from src.dedup import BloomFilter, Deduplicator
+from src.records import Record, Source
+
+
+class TestBloomFilter(unittest.TestCase):
+    """Bloom filter over digests, memory mapped from a file."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-dedup-')
+        self.file_path = os.path.join(self.work_dir.name, 'keys.bloom')
+        self.digests = [i.to_bytes(16, 'little') for i in range(1, 1001)]
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def test_add__contains(self):
+        bloom = BloomFilter(1000)
+        added = [bloom.add(digest) for digest in self.digests[:500]]
+        actual = (
+            added.count(True) < 10,
+            all(digest in bloom for digest in self.digests[:500]),
+            sum(digest in bloom for digest in self.digests[500:]) < 25,
+        )
+        bloom.close()
+        self.assertEqual(actual, (True, True, True))
+
+    def test_file__reopened(self):
+        bloom = BloomFilter(1000, file_path=self.file_path)
+        for digest in self.digests:
+            bloom.add(digest)
+        bloom.close()
+        bloom = BloomFilter(1000, file_path=self.file_path)
+        actual = (bloom.created, all(digest in bloom for digest in self.digests))
+        bloom.close()
+        self.assertEqual(actual, (False, True))
+
+
+class TestDeduplicator(unittest.TestCase):
+    """Duplicates by key across files and runs."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-dedup-')
+        self.db_path = os.path.join(self.work_dir.name, 'dedup.sqlite')
+        self.sources = [Source(f'{name}.csv', 'csv') for name in ('a', 'b')]
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def records(self, source, emails, checkpoints=()):
+        for i, email in enumerate(emails, 1):
+            yield Record(source, dict(email=email), checkpoint=(source.file_path, i, i) if i in checkpoints else None)
+
+    def emails(self, dedup, *streams):
+        emails = []
+        for records in streams:
+            emails.extend(record.data['email'] for record in dedup.filter(records) if record.data is not None)
+        return emails
+
+    def test_filter__across_files(self):
+        dedup = Deduplicator(['email'], self.db_path)
+        actual = self.emails(
+            dedup,
+            self.records(self.sources[0], ['a@example.com', 'b@example.com', 'A@Example.com ']),
+            self.records(self.sources[1], ['c@example.com', 'b@example.com']))
+        dedup.close()
+        self.assertEqual((actual, dedup.dropped), (['a@example.com', 'b@example.com', 'c@example.com'], 2))
+
+    def test_filter__across_runs(self):
+        dedup = Deduplicator(['email'], self.db_path)
+        self.emails(dedup, self.records(self.sources[0], ['a@example.com', 'b@example.com']))
+        dedup.close()
+        dedup = Deduplicator(['email'], self.db_path)
+        actual = self.emails(dedup, self.records(self.sources[1], ['b@example.com', 'c@example.com']))
+        dedup.close()
+        self.assertEqual((actual, dedup.dropped), (['c@example.com'], 1))
+
+    def test_filter__null_key_kept(self):
+        dedup = Deduplicator(['email', 'name'])
+        records = [Record(self.sources[0], dict(email='a@example.com', name=None)) for _ in range(3)]
+        actual = list(dedup.filter(iter(records)))
+        dedup.close()
+        self.assertEqual((len(actual), dedup.dropped), (3, 0))
+
+    def test_filter__filter_rebuilt(self):
+        dedup = Deduplicator(['email'], self.db_path)
+        self.emails(dedup, self.records(self.sources[0], ['a@example.com', 'b@example.com']))
+        dedup.close()
+        os.remove(f'{self.db_path}.bloom')
+        with self.assertLogs('pipeline.dedup', 'INFO') as logs:
+            dedup = Deduplicator(['email'], self.db_path)
+        actual = self.emails(dedup, self.records(self.sources[1], ['a@example.com', 'b@example.com', 'c@example.com']))
+        dedup.close()
+        self.assertEqual((actual, logs.output), (
+            ['c@example.com'], ['INFO:pipeline.dedup.Deduplicator:rebuilt filter keys=2']))
+
+    def test_filter__interrupted_run_resumed(self):
+        emails = [f'user{i}@example.com' for i in range(10)]
+        dedup = Deduplicator(['email'], self.db_path)
+
+        # interrupted after the checkpoint of row 4 was committed, keys after it were not
+        records = dedup.filter(self.records(self.sources[0], emails, checkpoints=(4,)))
+        first = [next(records).data['email'] for _ in range(7)]
+        dedup._connection.close()
+        dedup._filter.close()
+
+        # resumed from the checkpoint, rows after it are extracted again
+        dedup = Deduplicator(['email'], self.db_path)
+        second = self.emails(dedup, self.records(self.sources[0], emails[4:]))
+        dedup.close()
+        self.assertEqual((first, second, dedup.dropped), (emails[:7], emails[4:], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import csv
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from src.extractors import CsvExtractor, ZipCsvExtractor
+
+HEADER = ('Name', 'Email', 'Comment', 'Created At')
+
+
+def drain(records):
+    """Return the records of an extraction and whether it completed."""
+    drained = []
+    while True:
+        try:
+            drained.append(next(records))
+        except StopIteration as stop:
+            return drained, stop.value
+
+
+class TestCsvExtractorByteRanges(unittest.TestCase):
+    """Byte ranges of CSV files with quoted fields spanning lines."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-extractors-')
+        self.file_path = os.path.join(self.work_dir.name, 'data.csv')
+        self.rows = [
+            [f'user{i}', f'user{i}@example.com', f'line one\nline "two", {i}' if i % 7 == 0 else 'manager', '']
+            for i in range(2000)
+        ]
+        with open(self.file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            writer.writerows(self.rows)
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def extract(self, byte_range=None, use_mmap=False):
+        extractor = CsvExtractor(self.file_path, byte_range=byte_range, checkpoint_rows=0, use_mmap=use_mmap)
+        return [list(record.data) for record in extractor._extract()]
+
+    def test_byte_ranges__cover_file(self):
+        ranges = CsvExtractor(self.file_path).byte_ranges(1000)
+        self.assertEqual(
+            (ranges[-1][1], all(stop == start for (_, stop), (start, _) in zip(ranges, ranges[1:]))),
+            (os.path.getsize(self.file_path), True)
+        )
+
+    def test_byte_ranges__embedded_newlines(self):
+        for chunk_size in (50, 333, 1000):
+            ranges = CsvExtractor(self.file_path).byte_ranges(chunk_size)
+            actual = [row for byte_range in ranges for row in self.extract(byte_range)]
+            self.assertEqual(actual, self.rows)
+
+    def test_byte_ranges__embedded_newlines_across_blocks(self):
+        with mock.patch.object(CsvExtractor, 'BLOCK_SIZE', 64):
+            ranges = CsvExtractor(self.file_path).byte_ranges(333)
+        actual = [row for byte_range in ranges for row in self.extract(byte_range)]
+        self.assertEqual(actual, self.rows)
+
+    def test_byte_ranges__embedded_newlines_mmap(self):
+        ranges = CsvExtractor(self.file_path).byte_ranges(333)
+        actual = [row for byte_range in ranges for row in self.extract(byte_range, use_mmap=True)]
+        self.assertEqual(actual, self.rows)
+
+    def test_extract__whole_file(self):
+        self.assertEqual((self.extract(), self.extract(use_mmap=True)), (self.rows, self.rows))
+
+    def test_byte_ranges__without_rows(self):
+        header = (','.join(HEADER) + '\n').encode()
+        actual = []
+        for content in (header, b''):
+            with open(self.file_path, 'wb') as f:
+                f.write(content)
+            ranges = CsvExtractor(self.file_path).byte_ranges(1000)
+            for use_mmap in (False, True):
+                extractor = CsvExtractor(self.file_path, byte_range=ranges[0], checkpoint_rows=0, use_mmap=use_mmap)
+                actual.append((ranges,) + drain(extractor.extract()))
+        self.assertEqual(actual, [([(len(header), len(header))], [], True)] * 2 + [([(0, 0)], [], True)] * 2)
+
+
+class TestCsvExtractorMmap(unittest.TestCase):
+    """Tokenizing CSV files from a memory map."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-extractors-')
+        self.file_path = os.path.join(self.work_dir.name, 'data.csv')
+        lines = [','.join(HEADER)] + [f'user{i},user{i}@example.com,manager,' for i in range(20)]
+        lines[5] = 'user4,user4@example.com,"unterminated,'
+        with open(self.file_path, 'w', newline='') as f:
+            f.write('\n'.join(lines) + '\n')
+        self.middle = sum(len(line) + 1 for line in lines[:11])
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def extract(self, byte_range=None, incremental=False):
+        extractor = CsvExtractor(
+            self.file_path, byte_range=byte_range, checkpoint_rows=0, use_mmap=True, incremental=incremental)
+        return [record.data[0] for record in extractor._extract()]
+
+    def test_unterminated_quote__stops_at_range_end(self):
+        with self.assertLogs('pipeline.extractors.CsvExtractor', 'WARNING') as logs:
+            first = self.extract((len(','.join(HEADER)) + 1, self.middle))
+        second = self.extract((self.middle, os.path.getsize(self.file_path)))
+        self.assertEqual(
+            (first, second, 'unterminated quoted field' in logs.output[0]),
+            (['user0', 'user1', 'user2', 'user3', 'user4'], [f'user{i}' for i in range(10, 20)], True)
+        )
+
+    def test_unterminated_quote__incremental_left_for_next_run(self):
+        self.assertEqual(self.extract(incremental=True), ['user0', 'user1', 'user2', 'user3'])
+
+
+class TestZipCsvExtractor(unittest.TestCase):
+    """Archives are extracted whole, without checkpoints."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-extractors-')
+        self.file_path = os.path.join(self.work_dir.name, 'data.zip')
+        with zipfile.ZipFile(self.file_path, 'w') as archive:
+            for name in ('first.csv', 'second.csv'):
+                lines = [','.join(HEADER)] + [f'{name}{i},user{i}@example.com,manager,' for i in range(5)]
+                archive.writestr(name, '\n'.join(lines) + '\n')
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def test_extract__no_checkpoints(self):
+        extractor = ZipCsvExtractor(self.file_path, checkpoint_rows=2, incremental=True)
+        records = list(extractor.extract())
+        self.assertEqual(
+            ([record.source.file for record in records].count('second.csv'),
+             len(records),
+             [record.checkpoint for record in records if record.checkpoint],
+             extractor.incremental),
+            (5, 10, [], False)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.file_index import FileIndex
+
+
+class TestFileIndexCompact(unittest.TestCase):
+    """Compaction keeps entries of existing files, whatever their age."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-file-index-')
+        self.paths = []
+        for name in ('kept.csv', 'removed.csv'):
+            self.paths.append(os.path.join(self.work_dir.name, name))
+            with open(self.paths[-1], 'w') as f:
+                f.write(f'name\n{name}\n')
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def compact(self, retention, age):
+        file_index = FileIndex(hash_files=True, retention=retention)
+        with mock.patch('time.time', return_value=1000.0):
+            for path in self.paths:
+                file_index.add(path)
+        with open(self.paths[-1], 'rb') as f:
+            content = f.read()
+        os.remove(self.paths[-1])
+        with mock.patch('time.time', return_value=1000.0 + age):
+            evicted = file_index.compact()
+
+        # content of the removed file dropped again under another name
+        copy_path = os.path.join(self.work_dir.name, 'copy.csv')
+        with open(copy_path, 'wb') as f:
+            f.write(content)
+        return evicted, self.paths[0] in file_index, copy_path in file_index
+
+    def test_compact__no_retention(self):
+        self.assertEqual(self.compact(None, 0), (1, True, False))
+
+    def test_compact__within_retention(self):
+        self.assertEqual(self.compact(3600, 60), (0, True, True))
+
+    def test_compact__after_retention(self):
+        self.assertEqual(self.compact(3600, 100 * 3600), (1, True, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
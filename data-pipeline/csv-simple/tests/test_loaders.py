@@ -0,0 +1,147 @@
+import errno
+import glob
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from src.dedup import Deduplicator
+from src.loaders import Loader
+from src.records import Record, Source
+
+
+class TestLoaderCompleted(unittest.TestCase):
+    """Files are recorded as processed only once their output is written."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-loaders-')
+        self.source = Source('a.csv', 'csv')
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def payload(self):
+        for i in range(10):
+            yield Record(self.source, dict(name=f'user{i}'))
+        yield Record(self.source, None, completed=('a.csv', False))
+
+    def dump(self, output_format, **kwargs):
+        written = []
+        checkpoints = mock.Mock()
+
+        # output on disk when the file is added to the index
+        checkpoints.add.side_effect = lambda file_path, keep_checkpoint: written.extend(
+            os.path.getsize(path) for path in glob.glob(os.path.join(self.work_dir.name, '**', 'a-*'), recursive=True))
+        loader = Loader.get_instance(
+            output_format, checkpoints=checkpoints, output_dir=self.work_dir.name, encoder='json', **kwargs)
+        dumped = loader.dump(self.payload())
+        return dumped, checkpoints.add.call_args_list, bool(written) and all(written)
+
+    def test_completed__after_output_written(self):
+        for output_format in ('json', 'ndjson', 'json-array', 'columnar'):
+            for writers in (0, 2):
+                self.assertEqual(
+                    self.dump(output_format, writers=writers),
+                    (10, [mock.call('a.csv', False)], True),
+                    f'{output_format} writers={writers}')
+
+
+class TestLoaderWriters(unittest.TestCase):
+    """Writes of a single source run on all writers, unless they append to files."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-loaders-')
+        self.source = Source('a.csv', 'csv')
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def writer_threads(self, output_format):
+        threads = set()
+        loader = Loader.get_instance(
+            output_format, batch_size=2, output_dir=self.work_dir.name, encoder='json', writers=4)
+
+        def on_thread(function):
+            def write(*args):
+                threads.add(threading.current_thread().name)
+                return function(*args)
+            return write
+
+        loader._write_file = on_thread(loader._write_file)
+        loader._append = on_thread(loader._append)
+        dumped = loader.dump(Record(self.source, dict(name=f'user{i}')) for i in range(40))
+        return dumped, len(threads)
+
+    def test_dump__writers(self):
+        self.assertEqual(
+            [self.writer_threads(output_format) for output_format in ('json', 'json-array', 'ndjson', 'columnar')],
+            [(40, 4), (40, 4), (40, 1), (40, 1)]
+        )
+
+
+class TestLoaderFailedWrites(unittest.TestCase):
+    """Files whose output was not completely written are neither checkpointed any further nor completed."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-loaders-')
+        self.source = Source('a.csv', 'csv')
+        self.full = False
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def payload(self, start=0):
+        for i in range(start, 10):
+            yield Record(self.source, dict(name=f'user{i}'), checkpoint=('a.csv', i, i + 1) if i in (2, 5) else None)
+        yield Record(self.source, None, completed=('a.csv', False))
+
+    def fail_when_full(self, function):
+        def write(*args):
+            if self.full:
+                raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+            return function(*args)
+        return write
+
+    def loader(self, output_format, checkpoints, writers):
+        loader = Loader.get_instance(
+            output_format, batch_size=2, checkpoints=checkpoints, output_dir=self.work_dir.name, encoder='json',
+            writers=writers)
+        loader._write_file = self.fail_when_full(loader._write_file)
+        loader._append = self.fail_when_full(loader._append)
+        return loader
+
+    def test_dump__disk_full_after_checkpoint(self):
+        for output_format in ('json', 'ndjson', 'json-array', 'columnar'):
+            for writers in (0, 2):
+                self.full = False
+                checkpoints = mock.Mock()
+
+                # the disk fills up once the first checkpoint is committed
+                checkpoints.set_checkpoint.side_effect = lambda *args: setattr(self, 'full', True)
+                records = list(self.payload())
+                with self.assertLogs('pipeline.loaders', 'ERROR'):
+                    self.loader(output_format, checkpoints, writers).dump(iter(records))
+                self.assertEqual(
+                    ([call.args[:3] for call in checkpoints.set_checkpoint.call_args_list],
+                     checkpoints.add.call_count,
+                     [record.checkpoint for record in records if record.checkpoint],
+                     records[-1].completed),
+                    ([('a.csv', 2, 3)], 0, [('a.csv', 2, 3)], None),
+                    f'{output_format} writers={writers}')
+
+    def test_dump__dedup_keys_rolled_back(self):
+        dedup = Deduplicator(['name'])
+        checkpoints = mock.Mock()
+        checkpoints.set_checkpoint.side_effect = lambda *args: setattr(self, 'full', True)
+        with self.assertLogs('pipeline.loaders', 'ERROR'):
+            self.loader('ndjson', checkpoints, 2).dump(dedup.filter(self.payload()))
+
+        # the next run resumes after the committed checkpoint, its rows are no duplicates
+        self.full = False
+        dumped = self.loader('ndjson', mock.Mock(), 2).dump(dedup.filter(self.payload(3)))
+        self.assertEqual((dumped, dedup.dropped), (7, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
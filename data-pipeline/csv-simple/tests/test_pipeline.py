@@ -0,0 +1,171 @@
+import itertools
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+from src import extractors
+from src.file_index import FileIndex
+from src.loaders import read_columnar
+
+OUTPUT_FORMATS = ('json', 'ndjson', 'json-array', 'columnar')
+
+
+class PipelineTestCase(unittest.TestCase):
+    """Runs of the whole pipeline over an input directory, sharing a file index between runs."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-pipeline-')
+        self.file_path = os.path.join(self.work_dir.name, 'input', 'users.csv')
+        os.makedirs(os.path.dirname(self.file_path))
+        self.write('Name,Email,Comment,Created At\n')
+
+    def tearDown(self):
+        extractors.set_file_cache(FileIndex())
+        self.work_dir.cleanup()
+
+    def write(self, text, mode='w'):
+        with open(self.file_path, mode) as f:
+            f.write(text)
+
+    def rows(self, start, stop):
+        return ''.join(f'user{i},user{i}@example.com,developer,23-05-20\n' for i in range(start, stop))
+
+    def run_pipeline(self, output_dir, file_index, interrupt_after=None, **kwargs):
+        """Run the pipeline on the input file, stop extracting after interrupt_after records if given."""
+        extractors.set_file_cache(file_index)
+        transform = main.transform
+
+        def interrupted(log, records, metrics=None):
+            return itertools.islice(transform(log, records, metrics), interrupt_after)
+
+        with mock.patch.object(main, 'transform', transform if interrupt_after is None else interrupted):
+            main.main(
+                logging.getLogger('pipeline'), os.path.dirname(self.file_path), file_path=self.file_path,
+                file_index=file_index, output_dir=os.path.join(self.work_dir.name, output_dir), **kwargs)
+
+    def output(self, output_dir):
+        """Return output file path relative to output_dir -> content."""
+        output = {}
+        root = os.path.join(self.work_dir.name, output_dir)
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                with open(os.path.join(dir_path, file_name), 'rb') as f:
+                    output[os.path.relpath(os.path.join(dir_path, file_name), root)] = f.read()
+        return output
+
+
+class TestResume(PipelineTestCase):
+    """Extraction interrupted after a checkpoint continues from it with the loader state of the checkpoint."""
+
+    def setUp(self):
+        super(TestResume, self).setUp()
+        self.write(self.rows(0, 100), 'a')
+
+    def rows_written(self, output_format):
+        if output_format == 'columnar':
+            return sum(len(list(read_columnar(os.path.join(self.work_dir.name, output_format, name))))
+                       for name in self.output(output_format))
+        return sum(content.count(b'\n') for content in self.output(output_format).values())
+
+    def test_resume__same_output(self):
+        for output_format in OUTPUT_FORMATS:
+            options = dict(output_format=output_format, checkpoint_rows=10, batch_size=7)
+            self.run_pipeline(f'{output_format}-whole', FileIndex(), **options)
+            file_index = FileIndex()
+            with self.assertLogs('pipeline', 'INFO') as logs:
+                self.run_pipeline(f'{output_format}-resumed', file_index, interrupt_after=45, **options)
+                interrupted = self.file_path in file_index
+                self.run_pipeline(f'{output_format}-resumed', file_index, **options)
+            self.assertEqual(
+                (interrupted,
+                 self.file_path in file_index,
+                 any(f'resuming path={self.file_path} offset=' in line and 'row=40' in line for line in logs.output),
+                 self.output(f'{output_format}-resumed')),
+                (False, True, True, self.output(f'{output_format}-whole')),
+                output_format)
+
+    def test_resume__counters_continue(self):
+        file_index = FileIndex()
+        with self.assertLogs('pipeline', 'INFO'):
+            self.run_pipeline('json', file_index, interrupt_after=45, output_format='json', checkpoint_rows=10)
+            self.run_pipeline('json', file_index, output_format='json', checkpoint_rows=10)
+        self.assertEqual(
+            sorted(int(os.path.splitext(name)[0].rsplit('-', 1)[1]) for name in self.output('json')),
+            list(range(1, 101))
+        )
+
+    def test_resume__appended_output_truncated(self):
+        for output_format in ('ndjson', 'columnar'):
+            file_index = FileIndex()
+            options = dict(output_format=output_format, checkpoint_rows=10, batch_size=5)
+            with self.assertLogs('pipeline', 'INFO'):
+                self.run_pipeline(output_format, file_index, interrupt_after=45, **options)
+                interrupted = self.rows_written(output_format)
+
+                # rows after the checkpoint are dropped from the output when resuming, then extracted again
+                self.run_pipeline(output_format, file_index, interrupt_after=1, **options)
+            self.assertEqual((interrupted, self.rows_written(output_format)), (45, 41), output_format)
+
+
+class TestIncremental(PipelineTestCase):
+    """Append-only input files, extracted again from where the previous run stopped."""
+
+    def test_incremental__partial_line_left(self):
+        file_index = FileIndex()
+        self.write(self.rows(0, 10) + 'user10,user10@exa', 'a')
+        with self.assertLogs('pipeline', 'INFO'):
+            self.run_pipeline('ndjson', file_index, output_format='ndjson', incremental=True)
+        (content,) = self.output('ndjson').values()
+        self.assertEqual(
+            (content.count(b'\n'), b'user10' in content, file_index.get_checkpoint(self.file_path)[1]),
+            (10, False, 10)
+        )
+
+    def emails(self, output_dir, output_format):
+        """Return the emails of all records written to output_dir, sorted."""
+        emails = []
+        for name, content in self.output(output_dir).items():
+            if output_format == 'columnar':
+                records = list(read_columnar(os.path.join(self.work_dir.name, output_dir, name)))
+            elif output_format == 'ndjson':
+                records = [json.loads(line) for line in content.splitlines()]
+            else:
+                records = json.loads(content)
+            emails.extend(record['email'] for record in (records if isinstance(records, list) else [records]))
+        return sorted(emails)
+
+    def test_incremental__appended_rows(self):
+        appended = self.rows(0, 20)
+        for output_format in OUTPUT_FORMATS:
+            self.write('Name,Email,Comment,Created At\n')
+            file_index = FileIndex()
+            with self.assertLogs('pipeline.extractors', 'DEBUG') as logs:
+                for start, stop in ((0, 300), (300, 650), (650, len(appended))):
+
+                    # runs see partial lines, completed by the next append
+                    self.write(appended[start:stop], 'a')
+                    self.run_pipeline(
+                        f'{output_format}-incremental', file_index, output_format=output_format, incremental=True,
+                        batch_size=4)
+            with self.assertLogs('pipeline', 'INFO'):
+                self.run_pipeline(f'{output_format}-whole', FileIndex(), output_format=output_format, batch_size=4)
+
+            # each run extracts the rows appended since the previous one only
+            extracted = [int(line.rsplit('items=', 1)[1]) for line in logs.output if 'items=' in line]
+            self.assertEqual(
+                (len(extracted), sum(extracted), self.emails(f'{output_format}-incremental', output_format)),
+                (3, 20, sorted(f'user{i}@example.com' for i in range(20))),
+                output_format)
+
+            # output names continue over runs
+            if output_format in ('json', 'ndjson'):
+                self.assertEqual(
+                    self.output(f'{output_format}-incremental'), self.output(f'{output_format}-whole'), output_format)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+
+from src.processors import CsvProcessor
+
+
+class TestProcessorPlan(unittest.TestCase):
+    """Header plans of a processor shared between files and byte ranges."""
+
+    def test_get_plan__equal_headers(self):
+        processor = CsvProcessor()
+
+        # byte ranges of a file each extract their own copy of the header
+        headers = [['Name', 'Email', 'Unknown'] for _ in range(3)]
+        with self.assertLogs('pipeline.processors', 'WARNING') as logs:
+            processed = [processor.process(['user0', 'user0@example.com', 'x'], header) for header in headers]
+        self.assertEqual(
+            (processed, len(logs.output)),
+            ([dict(name='user0', email='user0@example.com')] * 3, 2)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from src import extractors
+from src.watchers import InotifyWatcher
+
+
+@unittest.skipUnless(InotifyWatcher.is_available(), 'inotify is not available')
+class TestInotifyWatcher(unittest.TestCase):
+    """The input directory is scanned on start and after event queue overflows only."""
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='test-watchers-')
+        self.write('a.csv')
+        self.watcher = InotifyWatcher(self.work_dir.name, 0.01, 0.01)
+        self.scan_input_dir = mock.patch.object(extractors, 'scan_input_dir', wraps=extractors.scan_input_dir)
+        self.scans = self.scan_input_dir.start()
+
+    def tearDown(self):
+        self.scan_input_dir.stop()
+        self.work_dir.cleanup()
+
+    def write(self, name):
+        with open(os.path.join(self.work_dir.name, name), 'w') as f:
+            f.write('name\nuser\n')
+
+    def names(self, file_paths):
+        return sorted(os.path.basename(file_path) for file_path in file_paths)
+
+    def test_watch__events_without_rescans(self):
+        watch = self.watcher.watch()
+        actual = [self.names(next(watch))]
+        for name in ('b.csv', 'c.csv'):
+
+            # more than a period without events
+            time.sleep(0.05)
+            self.write(name)
+            actual.append(self.names(next(watch)))
+        watch.close()
+        self.assertEqual((actual, self.scans.call_count), ([['a.csv'], ['b.csv'], ['c.csv']], 1))
+
+    def test_watch__rescan_after_overflow(self):
+        watch = self.watcher.watch()
+        actual = [self.names(next(watch))]
+        with mock.patch.object(self.watcher, '_read_events', return_value=True):
+            self.write('b.csv')
+            actual.append(self.names(next(watch)))
+        watch.close()
+        self.assertEqual((actual, self.scans.call_count), ([['a.csv'], ['a.csv', 'b.csv']], 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@ from lib import util
 
 
 def main(host, port):
-    api.source = util.AdminSource(util.build_dns())
+    api.source = util.AdminSource(util.build_dns(), **util.build_pool_options())
     api.app.run(host=host, port=port)
 
 
@@ -27,15 +27,9 @@ auth = HTTPBasicAuth()
 
 @auth.verify_password
 def verify_password(username, password):
-    if source.has_username(username) is True:
-        result = source.get_authentication_data(username)
-        hash_code = result['password_hash']
-        salt = result['password_salt']
-
-        # verify
-        if hash_code == hash_password(password, salt):
-            g.user = username
-            return True
+    if source.verify_password(username, password):
+        g.user = username
+        return True
     return False
 
 
@@ -46,16 +40,37 @@ admin_api = Blueprint('admin', __name__, url_prefix='/admin')
 @admin_api.route('/users', methods=['GET'])
 @auth.login_required
 def list_users():
-    data = dict(data=sorted(source.get_usernames()))
-    return jsonify(data), 200
+    try:
+        limit, after = util.extract_page(request)
+    except ValueError as error:
+        return jsonify(dict(error=str(error))), 400
+    if request.if_none_match:
+        response = util.not_modified(request, source.get_usernames_version(limit, after))
+        if response:
+            return response
+    usernames, next_cursor, version = source.get_usernames_page(limit, after)
+    data = dict(data=usernames)
+    if next_cursor is not None:
+        data['next'] = next_cursor
+    response = jsonify(data)
+    response.set_etag(version)
+    return response, 200
 
 
 @admin_api.route('/users/<int:user_id>', methods=('GET',))
 @auth.login_required
 def get_user(user_id):
-    data = source.get_user(user_id)
+    if request.if_none_match:
+
+        # only the version is read for clients with a current copy
+        response = util.not_modified(request, source.get_user_version(user_id))
+        if response:
+            return response
+    data, version = source.get_versioned_user(user_id)
     if data:
-        return jsonify(dict(data=data)), 200
+        response = jsonify(dict(data=data))
+        response.set_etag(version)
+        return response, 200
 
     # not found
     return jsonify(error='data not found'), 404
@@ -20,8 +20,9 @@ class BaseApiTestCase(unittest.TestCase):
     def setUp(self):
         self.test_app = api.app.test_client()
 
-    def get_authorised(self, path, data=None, username='test1', password='pw1'):
-        return self.test_app.get(path, data=data, headers={"Authorization": _basic_auth_str(username, password)})
+    def get_authorised(self, path, data=None, username='test1', password='pw1', headers=None, query_string=None):
+        headers = dict(headers or {}, Authorization=_basic_auth_str(username, password))
+        return self.test_app.get(path, data=data, headers=headers, query_string=query_string)
 
     def delete_authorised(self, path, username='test1', password='pw1'):
         return self.test_app.delete(path, headers={"Authorization": _basic_auth_str(username, password)})
@@ -50,6 +51,10 @@ class BaseApiTestCaseWithDB(BaseApiTestCase):
             util.insert_user(connection, 'two', 'test2', email='test2@example.com', password='pw2')
         self.test_source = util.AdminSource(dns)
 
+    def tearDown(self):
+        self.test_source.close()
+        super(BaseApiTestCaseWithDB, self).tearDown()
+
 
 def run():
     tests = unittest.TestLoader().discover(os.path.dirname(__file__))
@@ -15,6 +15,87 @@ class TestApiAdmin(BaseApiTestCaseWithDB):
             (dict(data=['test1', 'test2']), HTTPStatus.OK)
         )
 
+    def test_users_GET__paginated(self):
+        with mock.patch('api_simple.api.source', self.test_source):
+            first = self.get_authorised('/admin/users?limit=1')
+            second = self.get_authorised('/admin/users', query_string=dict(limit=1, after=first.json['next']))
+        self.assertEqual(
+            (first.json, first.status_code, second.json, second.status_code),
+            (dict(data=['test1'], next='test1'), HTTPStatus.OK, dict(data=['test2']), HTTPStatus.OK)
+        )
+
+    def test_users_GET__paginated_cursor_encoded(self):
+        self.test_source.add_user('three', 'test1 & co', 'test3@example.com', '3' * 64, '3' * 36)
+        with mock.patch('api_simple.api.source', self.test_source):
+            first = self.get_authorised('/admin/users', query_string=dict(limit=2))
+            second = self.get_authorised('/admin/users', query_string=dict(limit=2, after=first.json['next']))
+        self.assertEqual(
+            (first.json, second.json),
+            (dict(data=['test1', 'test1 & co'], next='test1 & co'), dict(data=['test2']))
+        )
+
+    def test_users_GET__after_last(self):
+        with mock.patch('api_simple.api.source', self.test_source):
+            actual = self.get_authorised('/admin/users?after=test2')
+        self.assertEqual(
+            (actual.json, actual.status_code),
+            (dict(data=[]), HTTPStatus.OK)
+        )
+
+    def test_users_GET__bad_limit(self):
+        with mock.patch('api_simple.api.source', self.test_source):
+            not_a_number = self.get_authorised('/admin/users?limit=many')
+            too_small = self.get_authorised('/admin/users?limit=0')
+        self.assertEqual(
+            (not_a_number.status_code, too_small.status_code),
+            (HTTPStatus.BAD_REQUEST, HTTPStatus.BAD_REQUEST)
+        )
+
+    def test_users_GET__not_modified(self):
+        with mock.patch('api_simple.api.source', self.test_source):
+            first = self.get_authorised('/admin/users')
+            actual = self.get_authorised('/admin/users', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(
+            (actual.data, actual.status_code, actual.headers['ETag']),
+            (b'', HTTPStatus.NOT_MODIFIED, first.headers['ETag'])
+        )
+
+    def test_users_GET__modified(self):
+        with mock.patch('api_simple.api.source', self.test_source):
+            first = self.get_authorised('/admin/users')
+            self.put_authorised('/admin/users/2', data=dict(username='renamed'))
+            actual = self.get_authorised('/admin/users', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(
+            (actual.json, actual.status_code, actual.headers['ETag'] == first.headers['ETag']),
+            (dict(data=['renamed', 'test1']), HTTPStatus.OK, False)
+        )
+
+    def test_user_GET__not_modified(self):
+        with mock.patch('api_simple.api.source', self.test_source):
+            first = self.get_authorised('/admin/users/2')
+            actual = self.get_authorised('/admin/users/2', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(
+            (first.status_code, actual.data, actual.status_code),
+            (HTTPStatus.OK, b'', HTTPStatus.NOT_MODIFIED)
+        )
+
+    def test_user_GET__modified(self):
+        with mock.patch('api_simple.api.source', self.test_source):
+            first = self.get_authorised('/admin/users/2')
+            self.put_authorised('/admin/users/2', data=dict(name='changed'))
+            actual = self.get_authorised('/admin/users/2', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(
+            (actual.json['data']['name'], actual.status_code, actual.headers['ETag'] == first.headers['ETag']),
+            ('changed', HTTPStatus.OK, False)
+        )
+
+    def test_user_GET__not_modified_deleted(self):
+        with mock.patch('api_simple.api.source', self.test_source):
+            first = self.get_authorised('/admin/users/2')
+            self.delete_authorised('/admin/users/2')
+            actual = self.get_authorised('/admin/users/2', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(actual.status_code, HTTPStatus.NOT_FOUND)
+
     def test_users_GET__unauthenticated(self):
         with mock.patch('api_simple.api.source', self.test_source):
             actual = self.test_app.get('/admin/users')
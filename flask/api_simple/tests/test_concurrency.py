@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from api_simple.tests import BaseApiTestCaseWithDB
+from lib import util
+
+
+class TestConcurrency(BaseApiTestCaseWithDB):
+    """AdminSource calls from concurrent threads, kept correct by transactions and constraints."""
+    THREADS = 8
+
+    def setUp(self):
+        super(TestConcurrency, self).setUp()
+        self.test_source.close()
+        self.test_source = util.AdminSource(self.test_source._dns, max_size=self.THREADS)
+        self.barrier = threading.Barrier(self.THREADS)
+
+    def run_concurrently(self, function, args_list):
+        """Run function with each args from args_list on its own thread, started together."""
+
+        def run(args):
+            self.barrier.wait()
+            try:
+                return function(*args)
+            except util.DatabaseError as error:
+                return error
+
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            return list(executor.map(run, args_list))
+
+    def test_add_user__same_username(self):
+        actual = self.run_concurrently(self.test_source.add_user, [
+            ('same', 'same', f'same{i}@example.com', f'{i:064d}', f'{i:036d}') for i in range(self.THREADS)
+        ])
+        self.assertEqual(
+            (sum(isinstance(result, int) for result in actual),
+             sum(isinstance(result, util.DatabaseError) for result in actual),
+             self.test_source.get_usernames().count('same')),
+            (1, self.THREADS - 1, 1)
+        )
+
+    def test_add_user__distinct_usernames(self):
+        actual = self.run_concurrently(self.test_source.add_user, [
+            (f'new{i}', f'new{i}', f'new{i}@example.com', f'{i:064d}', f'{i:036d}') for i in range(self.THREADS)
+        ])
+        self.assertEqual(
+            (len(set(actual)), all(isinstance(result, int) for result in actual), len(self.test_source.get_ids())),
+            (self.THREADS, True, self.THREADS + 2)
+        )
+
+    def test_update_user__same_username(self):
+        user_ids = [
+            self.test_source.add_user(f'new{i}', f'new{i}', f'new{i}@example.com', f'{i:064d}', f'{i:036d}')
+            for i in range(self.THREADS)
+        ]
+        actual = self.run_concurrently(
+            lambda user_id: self.test_source.update_user(user_id, username='same'),
+            [(user_id,) for user_id in user_ids])
+        self.assertEqual(
+            (actual.count(None), self.test_source.get_usernames().count('same')),
+            (1, 1)
+        )
+
+    def test_delete_user__same_user(self):
+        actual = self.run_concurrently(self.test_source.delete_user, [(1,)] * self.THREADS)
+        self.assertEqual(
+            (actual.count(None), self.test_source.has_username('test1')),
+            (1, False)
+        )
+
+    def test_verify_password__concurrent(self):
+        actual = self.run_concurrently(
+            self.test_source.verify_password,
+            [('test1', 'pw1'), ('test2', 'pw2'), ('test1', 'pw2'), ('not_a_user', 'pw1')] * (self.THREADS // 4))
+        self.assertEqual(actual, [True, True, False, False] * (self.THREADS // 4))
+
+    def test_reads_not_blocked_by_pending_write(self):
+
+        # a write waiting for a row lock held by another transaction
+        with util.connection(self.test_source._dns) as blocker:
+            with blocker.cursor() as cursor:
+                cursor.execute("UPDATE users SET name = 'blocked' WHERE id = 2;")
+            writer = threading.Thread(target=self.test_source.update_user, args=(2,), kwargs=dict(name='waiting'))
+            writer.start()
+            time.sleep(0.2)
+            started = time.monotonic()
+            actual = (
+                self.test_source.has_username('test1'),
+                self.test_source.verify_password('test1', 'pw1'),
+                self.test_source.get_user(1)['name'],
+                self.test_source.update_user(1, name='updated'),
+            )
+            elapsed = time.monotonic() - started
+            blocker.rollback()
+        writer.join()
+        self.assertEqual(
+            (actual, elapsed < 1, self.test_source.get_user(2)['name']),
+            ((True, True, 'one', None), True, 'waiting')
+        )
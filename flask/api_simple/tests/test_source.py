@@ -0,0 +1,144 @@
+import threading
+from unittest import mock
+
+from api_simple.tests import BaseApiTestCaseWithDB
+from lib import util
+
+
+class TestConnectionPool(BaseApiTestCaseWithDB):
+    """Pooled connections of AdminSource."""
+
+    def setUp(self):
+        super(TestConnectionPool, self).setUp()
+        self.test_pool = util.ConnectionPool(self.test_source._dns, min_size=1, max_size=2, timeout=0.1)
+
+    def tearDown(self):
+        self.test_pool.close()
+        super(TestConnectionPool, self).tearDown()
+
+    def test_source__connections_returned(self):
+        for _ in range(20):
+            self.test_source.get_usernames()
+            self.test_source.get_user(1)
+            self.test_source.has_username('test1')
+        self.assertEqual(
+            (self.test_source._pool.size, self.test_source._pool.idle),
+            (1, 1)
+        )
+
+    def test_source__connection_returned_on_error(self):
+        with self.assertRaises(util.DatabaseError):
+            self.test_source.add_user('duplicate', 'test1', 'duplicate@example.com', 'hash', 'salt')
+        self.assertEqual(
+            (self.test_source._pool.size, self.test_source._pool.idle, self.test_source.get_usernames()),
+            (1, 1, ['test1', 'test2'])
+        )
+
+    def test_getconn__reuses_connection(self):
+        with self.test_pool.connection() as first:
+            pass
+        with self.test_pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+
+    def test_getconn__timeout(self):
+        with self.test_pool.connection(), self.test_pool.connection():
+            with self.assertRaises(util.DatabaseError):
+                self.test_pool.getconn()
+        self.assertEqual(self.test_pool.size, 2)
+
+    def test_getconn__waits_for_returned_connection(self):
+        self.test_pool.timeout = 5
+        connections = [self.test_pool.getconn(), self.test_pool.getconn()]
+        timer = threading.Timer(0.1, self.test_pool.putconn, args=(connections[0],))
+        timer.start()
+        actual = self.test_pool.getconn()
+        timer.join()
+        self.test_pool.putconn(actual)
+        self.test_pool.putconn(connections[1])
+        self.assertIs(actual, connections[0])
+
+    def test_getconn__replaces_broken_connection(self):
+        with self.test_pool.connection() as broken:
+            broken.close()
+        with self.test_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+                row = cursor.fetchone()
+        self.assertEqual(
+            (connection is broken, row[0], self.test_pool.size),
+            (False, 1, 1)
+        )
+
+    def test_getconn__recycles_old_connection(self):
+        with self.test_pool.connection() as first:
+            pass
+        self.test_pool.recycle = 0
+        with self.test_pool.connection() as second:
+            pass
+        self.assertEqual(
+            (second is first, bool(first.closed)),
+            (False, True)
+        )
+
+    def test_putconn__rolls_back_open_transaction(self):
+        with self.test_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM users;")
+        self.assertEqual(self.test_source.get_usernames(), ['test1', 'test2'])
+
+
+class TestVerifyPassword(BaseApiTestCaseWithDB):
+    """Credential verification of AdminSource, with its cache of verified credentials."""
+
+    def test_verify_password__ok(self):
+        self.assertEqual(
+            (self.test_source.verify_password('test1', 'pw1'), self.test_source.verify_password('test1', 'pw1')),
+            (True, True)
+        )
+
+    def test_verify_password__wrong_password(self):
+        self.assertEqual(
+            (self.test_source.verify_password('test1', 'pw2'), self.test_source.verify_password('not_a_user', 'pw1')),
+            (False, False)
+        )
+
+    def test_verify_password__cached(self):
+        self.test_source.verify_password('test1', 'pw1')
+        with mock.patch.object(self.test_source, 'get_credentials') as get_credentials:
+            actual = self.test_source.verify_password('test1', 'pw1')
+        self.assertEqual((actual, get_credentials.call_count), (True, 0))
+
+    def test_verify_password__wrong_password_not_cached(self):
+        self.test_source.verify_password('test1', 'pw1')
+        with mock.patch.object(self.test_source, 'get_credentials', return_value=None) as get_credentials:
+            actual = self.test_source.verify_password('test1', 'pw2')
+        self.assertEqual((actual, get_credentials.call_count), (False, 1))
+
+    def test_verify_password__expired(self):
+        self.test_source._credentials.ttl = 0
+        self.test_source.verify_password('test1', 'pw1')
+        with mock.patch.object(self.test_source, 'get_credentials', return_value=None) as get_credentials:
+            actual = self.test_source.verify_password('test1', 'pw1')
+        self.assertEqual((actual, get_credentials.call_count), (False, 1))
+
+    def test_verify_password__invalidated_by_update(self):
+        self.test_source.verify_password('test1', 'pw1')
+        self.test_source.update_user(1, password='new')
+        self.assertEqual(
+            (self.test_source.verify_password('test1', 'pw1'), self.test_source.verify_password('test1', 'new')),
+            (False, True)
+        )
+
+    def test_verify_password__invalidated_by_rename(self):
+        self.test_source.verify_password('test1', 'pw1')
+        self.test_source.update_user(1, username='renamed')
+        self.assertEqual(
+            (self.test_source.verify_password('test1', 'pw1'), self.test_source.verify_password('renamed', 'pw1')),
+            (False, True)
+        )
+
+    def test_verify_password__invalidated_by_delete(self):
+        self.test_source.verify_password('test1', 'pw1')
+        self.test_source.delete_user(1)
+        self.assertEqual(self.test_source.verify_password('test1', 'pw1'), False)
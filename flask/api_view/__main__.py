@@ -7,7 +7,7 @@ from lib import util
 
 
 def main(host, port):
-    source = util.AdminSource(util.build_dns())
+    source = util.AdminSource(util.build_dns(), **util.build_pool_options())
 
     # init server
     app = Flask(api.__name__)
@@ -45,15 +45,34 @@ class AdminView(util.SourceView):
     def get(self, user_id):
         if user_id is None:
 
-            # list usernames
-            data = dict(data=sorted(self.source.get_usernames()))
-            return jsonify(data), 200
+            # list usernames, a page at a time
+            try:
+                limit, after = util.extract_page(request)
+            except ValueError as error:
+                return jsonify(dict(error=str(error))), 400
+            if request.if_none_match:
+                response = util.not_modified(request, self.source.get_usernames_version(limit, after))
+                if response:
+                    return response
+            usernames, next_cursor, version = self.source.get_usernames_page(limit, after)
+            data = dict(data=usernames)
+            if next_cursor is not None:
+                data['next'] = next_cursor
+            response = jsonify(data)
+            response.set_etag(version)
+            return response, 200
         else:
 
-            # get user
-            data = self.source.get_user(user_id)
+            # get user, only its version for clients with a current copy
+            if request.if_none_match:
+                response = util.not_modified(request, self.source.get_user_version(user_id))
+                if response:
+                    return response
+            data, version = self.source.get_versioned_user(user_id)
             if data:
-                return jsonify(dict(data=data)), 200
+                response = jsonify(dict(data=data))
+                response.set_etag(version)
+                return response, 200
 
             # not found
             return jsonify(error='data not found'), 404
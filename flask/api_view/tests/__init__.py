@@ -21,8 +21,9 @@ class BaseApiTestCase(unittest.TestCase):
         self.test_api = api.ApiServer(app)
         self.test_app = app.test_client()
 
-    def get_authorised(self, path, data=None, username='test1', password='pw1'):
-        return self.test_app.get(path, data=data, headers={"Authorization": _basic_auth_str(username, password)})
+    def get_authorised(self, path, data=None, username='test1', password='pw1', headers=None, query_string=None):
+        headers = dict(headers or {}, Authorization=_basic_auth_str(username, password))
+        return self.test_app.get(path, data=data, headers=headers, query_string=query_string)
 
     def delete_authorised(self, path, username='test1', password='pw1'):
         return self.test_app.delete(path, headers={"Authorization": _basic_auth_str(username, password)})
@@ -52,6 +53,10 @@ class BaseApiTestCaseWithDB(BaseApiTestCase):
             util.insert_user(connection, 'two', 'test2', email='test2@example.com', password='pw2')
         self.test_source = util.AdminSource(dns)
 
+    def tearDown(self):
+        self.test_source.close()
+        super(BaseApiTestCaseWithDB, self).tearDown()
+
 
 def run():
     tests = unittest.TestLoader().discover(os.path.dirname(__file__))
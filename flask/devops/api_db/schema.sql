@@ -4,5 +4,18 @@ CREATE TABLE IF NOT EXISTS users (
   username VARCHAR(64) UNIQUE NOT NULL,
   email VARCHAR(64) UNIQUE NOT NULL,
   password_hash CHAR(64) UNIQUE NOT NULL,
-  password_salt CHAR(36) UNIQUE NOT NULL
-);
\ No newline at end of file
+  password_salt CHAR(36) UNIQUE NOT NULL,
+  version INTEGER NOT NULL DEFAULT 1
+);
+
+-- migrate databases created before users.version, safe to run again
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1
+    FROM information_schema.columns
+    WHERE table_name = 'users' AND column_name = 'version'
+  ) THEN
+    ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+  END IF;
+END $$;
@@ -1,10 +1,15 @@
+from collections import OrderedDict, deque
 from configparser import ConfigParser
-from hashlib import sha256
+from contextlib import contextmanager
+from hashlib import blake2b, sha256
+import os
 import threading
+import time
 import uuid
 
 import psycopg2
-from flask import g
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from flask import g, make_response
 from flask.views import MethodView
 import requests
 
@@ -46,6 +51,35 @@ def extract_data(request):
     return data
 
 
+def extract_page(request, default_limit=100, max_limit=1000):
+    """
+    Extract keyset pagination parameters from HTTP request query string.
+
+    :param request: HTTP request object
+    :return: (limit, after) tuple, after None for the first page
+    """
+    try:
+        limit = int(request.args.get('limit', default_limit))
+    except ValueError:
+        raise ValueError('bad limit in request')
+    if not 0 < limit <= max_limit:
+        raise ValueError(f'limit must be between 1 and {max_limit}')
+    return limit, request.args.get('after') or None
+
+
+def not_modified(request, etag):
+    """
+    Return a 304 response if the HTTP request's If-None-Match header matches etag, None otherwise.
+
+    :param request: HTTP request object
+    :param etag: unquoted entity tag of the current representation
+    """
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+
 def build_dns(**overrides):
     with open(CONFIG_FILE, 'r') as f:
         parser = ConfigParser()
@@ -59,6 +93,16 @@ def build_dns(**overrides):
         return ' '.join([f"{k}='{v}'" for k, v in params.items()])
 
 
+def build_pool_options():
+    """Return ConnectionPool keyword arguments from the optional 'pool' section of the configuration file."""
+    with open(CONFIG_FILE, 'r') as f:
+        parser = ConfigParser()
+        parser.read_file(f)
+        if not parser.has_section('pool'):
+            return {}
+        return {key: float(value) if '.' in value else int(value) for key, value in parser.items('pool')}
+
+
 def connection(dns=None):
     dns = dns or build_dns()
     return psycopg2.connect(dns, cursor_factory=DictCursor)
@@ -92,18 +136,220 @@ class DatabaseError(sqlite3.Error):
     """Database error exception."""
 
 
+class ConnectionPool(object):
+    """
+    Thread-safe pool of database connections.
+
+    Opens min_size connections up front and up to max_size on demand. A checkout waits up to timeout seconds for a
+    connection to be returned before raising DatabaseError. Connections idle for longer than check_idle seconds are
+    checked with a cheap query before they are handed out, broken ones and ones older than recycle seconds are
+    replaced.
+    """
+    MIN_SIZE = 1
+    MAX_SIZE = 10
+    TIMEOUT = 30
+    RECYCLE = 60 * 60
+    CHECK_IDLE = 30
+
+    def __init__(self, dns, min_size=None, max_size=None, timeout=None, recycle=None, check_idle=None):
+        self.dns = dns
+        self.min_size = self.MIN_SIZE if min_size is None else min_size
+        self.max_size = max(self.min_size, max_size or self.MAX_SIZE)
+        self.timeout = self.TIMEOUT if timeout is None else timeout
+        self.recycle = self.RECYCLE if recycle is None else recycle
+        self.check_idle = self.CHECK_IDLE if check_idle is None else check_idle
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._opened_at = {}
+        self._size = 0
+        self._closed = False
+        for _ in range(self.min_size):
+            self._size += 1
+            self._idle.append((self._open(), time.monotonic()))
+
+    def _open(self):
+        """Open a connection for a slot already counted in the pool size."""
+        try:
+            connection = psycopg2.connect(self.dns, cursor_factory=DictCursor)
+        except psycopg2.Error as error:
+            self._release()
+            raise DatabaseError(error)
+        self._opened_at[connection] = time.monotonic()
+        return connection
+
+    def _release(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _close(self, connection):
+        self._opened_at.pop(connection, None)
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _discard(self, connection):
+        self._close(connection)
+        self._release()
+
+    def _expired(self, connection):
+        return connection.closed or time.monotonic() - self._opened_at.get(connection, 0) > self.recycle
+
+    @staticmethod
+    def _healthy(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def getconn(self):
+        """Check out a connection, it must be returned with putconn."""
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise DatabaseError('connection pool is closed')
+                if self._idle:
+
+                    # most recently returned first, least likely to be stale
+                    connection, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    connection = returned_at = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DatabaseError(f'no database connection available within {self.timeout}s')
+                self._condition.wait(remaining)
+        if connection is None:
+            return self._open()
+        if self._expired(connection) or (
+                time.monotonic() - returned_at > self.check_idle and not self._healthy(connection)):
+
+            # replaced in the same slot
+            self._close(connection)
+            return self._open()
+        return connection
+
+    def putconn(self, connection):
+        """Return a checked out connection, rolling back a transaction left open."""
+        if not connection.closed and connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                pass
+        if self._closed or self._expired(connection):
+            self._discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the context, returned to the pool however the context is left."""
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    @property
+    def size(self):
+        """Number of open connections, idle or checked out."""
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def close(self):
+        """Close idle connections, checked out ones are closed when they are returned."""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+class CredentialCache(object):
+    """
+    Bounded cache of verified credentials, expiring after ttl seconds.
+
+    Keys are the username and a keyed digest of the password, the key being random per process, so the cache never
+    holds passwords. Entries are invalidated per user id; invalidation is per process, other processes see changes
+    once their entries expire.
+    """
+    SIZE = 1024
+    TTL = 60
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size or self.SIZE
+        self.ttl = self.TTL if ttl is None else ttl
+        self.generation = 0
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, username, password):
+        return username, blake2b(password.encode(), key=self._key, digest_size=16).digest()
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def add(self, key, user_id, generation):
+        """Add verified credentials, unless entries were invalidated since generation was read."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, user_id)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self.generation += 1
+            for key in [key for key, (_, entry_id) in self._entries.items() if entry_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
 class Source(object):
-    """Parent class for data access objects."""
+    """Parent class for data access objects, borrowing connections from a ConnectionPool."""
     _dns = None
-    _lock = None
+    _pool = None
 
-    def __init__(self, dns):
+    def __init__(self, dns, **pool_options):
         print(dns)
         self._dns = dns
-        self._lock = threading.Lock()
+        self._pool = ConnectionPool(dns, **pool_options)
 
     def get_connection(self):
-        return psycopg2.connect(self._dns, cursor_factory=DictCursor)
+        """Return a context borrowing a pooled connection."""
+        return self._pool.connection()
+
+    def close(self):
+        self._pool.close()
 
     @staticmethod
     def row_to_dict(row, filter_id=True):
@@ -111,37 +357,66 @@ class Source(object):
 
 
 class AdminSource(Source):
-    """Data access object for 'users' table."""
+    """
+    Data access object for 'users' table, caching verified credentials (see CredentialCache).
+
+    Writes are single statements in their own transaction, uncommitted ones are rolled back when the connection is
+    returned; uniqueness is enforced by the table constraints, violations raise DatabaseError.
+    """
+    _credentials = None
+
+    def __init__(self, dns, credential_cache_size=None, credential_ttl=None, **pool_options):
+        super(AdminSource, self).__init__(dns, **pool_options)
+        self._credentials = CredentialCache(credential_cache_size, credential_ttl)
 
     def get_ids(self):
-        with self.get_connection().cursor() as cursor:
-            cursor.execute("SELECT id FROM users;")
-            rs = cursor.fetchall()
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT id FROM users;")
+                rs = cursor.fetchall()
         return [row['id'] for row in rs]
 
     def get_user(self, user_id):
-        with self.get_connection().cursor() as cursor:
-            cursor.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-            row = cursor.fetchone()
+        return self.get_versioned_user(user_id)[0]
+
+    def get_versioned_user(self, user_id):
+        """Return user data and its version token, (None, None) if there is no such user."""
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
+                row = cursor.fetchone()
         if row:
-            return self.row_to_dict(row)
+            data = self.row_to_dict(row)
+            return data, str(data.pop('version'))
+        return None, None
+
+    def get_user_version(self, user_id):
+        """Return the version token of user, None if there is no such user; only the version is read."""
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT version FROM users WHERE id = %s;", (user_id,))
+                row = cursor.fetchone()
+        if row:
+            return str(row['version'])
 
     def add_user(self, name, username, email, password_hash, password_salt):
-        with self._lock:
-            try:
-                with self.get_connection() as connection:
-                    with connection.cursor() as cursor:
-                        cursor.execute(
-                            """
-                            INSERT INTO users (name, username, email, password_hash, password_salt)
-                                VALUES (%s, %s, %s, %s, %s)
-                            Returning id;
-                            """,
-                            (name, username, email, password_hash, password_salt))
-                        connection.commit()
-                        return cursor.fetchone()['id']
-            except psycopg2.errors.DatabaseError as error:
-                raise DatabaseError(error)
+        try:
+            with self.get_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        INSERT INTO users (name, username, email, password_hash, password_salt)
+                            VALUES (%s, %s, %s, %s, %s)
+                        Returning id;
+                        """,
+                        (name, username, email, password_hash, password_salt))
+                    user_id = cursor.fetchone()['id']
+                connection.commit()
+                return user_id
+        except psycopg2.Error as error:
+
+            # unique violations included: the constraints decide, not a check before the insert
+            raise DatabaseError(error)
 
     def update_user(self, user_id, **kwargs):
         query = """
@@ -160,83 +435,154 @@ class AdminSource(Source):
                 else:
                     block_parts.append('{} = %s'.format(name))
                     values.append(value)
+        if not block_parts:
+            raise DatabaseError('UPDATE failed: no values')
+
+        # every change of the row is a new version, see get_user_version
+        block_parts.append('version = version + 1')
         values.append(user_id)
-        with self._lock:
-            try:
-                with self.get_connection() as connection:
-                    with connection.cursor() as cursor:
-                        cursor.execute(
-                            query.format(block=', '.join(block_parts)),
-                            values
-                        )
-                        connection.commit()
-                        if cursor.rowcount != 1:
-                            raise DatabaseError('UPDATE failed')
-            except ValueError as error:
-                raise DatabaseError(error)
+        try:
+            with self.get_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        query.format(block=', '.join(block_parts)),
+                        values
+                    )
+                    if cursor.rowcount != 1:
+                        raise DatabaseError('UPDATE failed')
+                connection.commit()
+        except (ValueError, psycopg2.Error) as error:
+            raise DatabaseError(error)
+        self._credentials.invalidate(user_id)
 
     def delete_user(self, user_id):
-        with self._lock:
+        try:
             with self.get_connection() as connection:
                 with connection.cursor() as cursor:
                     cursor.execute("DELETE FROM users WHERE id = %s RETURNING id;", (user_id,))
-                    connection.commit()
                     if cursor.rowcount != 1:
                         raise DatabaseError('DELETE failed')
+                connection.commit()
+        except psycopg2.Error as error:
+            raise DatabaseError(error)
+        self._credentials.invalidate(user_id)
 
     def has_username(self, username):
-        with self._lock:
-            with self.get_connection() as connection:
-                with connection.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT EXISTS (
-                          SELECT 1
-                          FROM users
-                          WHERE username = %s ) """, (username,))
-                    row = cursor.fetchone()
-                    return bool(row[0])
-
-    def get_usernames(self):
-        with self.get_connection().cursor() as cursor:
-            cursor.execute("SELECT id, username FROM users")
-            rs = cursor.fetchall()
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT EXISTS (
+                      SELECT 1
+                      FROM users
+                      WHERE username = %s ) """, (username,))
+                row = cursor.fetchone()
+                return bool(row[0])
+
+    def get_usernames(self, limit=None, after=None):
+        """Return usernames in order, at most limit of them and only those after username after if given."""
+        query = "SELECT username FROM users {where} ORDER BY username LIMIT %s;"
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+
+                # keyset pagination on the unique username index, no OFFSET scanning skipped rows
+                cursor.execute(*self._page_query(query, limit, after))
+                rs = cursor.fetchall()
         return [row['username'] for row in rs]
 
-    def get_authentication_data(self, username):
-        with self.get_connection().cursor() as cursor:
-            cursor.execute("""
-                SELECT password_hash,
-                       password_salt
-                FROM users
-                WHERE username = %s """, (username, ))
-            row = cursor.fetchone()
-        return self.row_to_dict(row)
+    def get_usernames_page(self, limit, after=None):
+        """
+        Return a page of limit usernames after after, the cursor of the next page (None on the last page) and the
+        version token of the page.
+        """
+        query = "SELECT id, username, version FROM users {where} ORDER BY username LIMIT %s;"
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(*self._page_query(query, limit + 1, after))
+                rs = cursor.fetchall()
+        version = self._page_version(','.join(f"{row['id']}:{row['version']}" for row in rs))
+        usernames = [row['username'] for row in rs]
+        if len(usernames) > limit:
+            return usernames[:limit], usernames[limit - 1], version
+        return usernames, None, version
+
+    def get_usernames_version(self, limit, after=None):
+        """Return the version token of a page of get_usernames_page, only ids and versions are read."""
+        query = """
+            SELECT coalesce(string_agg(id || ':' || version, ',' ORDER BY username), '') AS versions
+            FROM (
+              SELECT id, username, version
+              FROM users {where}
+              ORDER BY username
+              LIMIT %s) AS page;"""
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(*self._page_query(query, limit + 1, after))
+                row = cursor.fetchone()
+        return self._page_version(row['versions'])
+
+    @staticmethod
+    def _page_query(query, limit, after):
+        if after is None:
+            return query.format(where=''), (limit,)
+        return query.format(where='WHERE username > %s'), (after, limit)
+
+    @staticmethod
+    def _page_version(versions):
+
+        # changes with rows entering or leaving the page and with updates of its rows
+        return blake2b(versions.encode(), digest_size=16).hexdigest()
+
+    def get_credentials(self, username):
+        """Return id, password hash and salt of username, None if there is no such user."""
+        with self.get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id,
+                           password_hash,
+                           password_salt
+                    FROM users
+                    WHERE username = %s """, (username, ))
+                row = cursor.fetchone()
+        if row:
+            return self.row_to_dict(row, filter_id=False)
+
+    def verify_password(self, username, password):
+        """Verify credentials, from the cache of verified credentials or with a single query."""
+        key = self._credentials.key(username, password)
+        if key in self._credentials:
+            return True
+        generation = self._credentials.generation
+        credentials = self.get_credentials(username)
+        if credentials and credentials['password_hash'] == hash_password(password, credentials['password_salt']):
+            self._credentials.add(key, credentials['id'], generation)
+            return True
+        return False
 
 
 def get_verify_password(source):
     """Factory function to provide verify_password closures with access to DB source for HTTPBasicAuth instances."""
 
     def verify_password(username, password):
-        if source.has_username(username) is True:
-            result = source.get_authentication_data(username)
-            hash_code = result['password_hash']
-            salt = result['password_salt']
-
-            # verify
-            if hash_code == hash_password(password, salt):
-                g.user = username
-                return True
+        if source.verify_password(username, password):
+            g.user = username
+            return True
         return False
     return verify_password
 
 
 class SourceView(MethodView):
     """Parent class for MethodView objects handling data source and data extraction."""
-    decorators = []
     source = None
 
     def __init__(self, source):
         self.source = source
+
+    @classmethod
+    def as_view(cls, name, source, **class_kwargs):
+        """Return the view function, requiring authentication against source."""
+        view = super(SourceView, cls).as_view(name, source=source, **class_kwargs)
+
+        # per view, the authentication of one source must not leak into views of another
         auth = HTTPBasicAuth()
         auth.verify_password(get_verify_password(source))
-        self.decorators.append(auth.login_required)
+        return auth.login_required(view)